@@ -0,0 +1,132 @@
+"""
+Paginated, filtered and projected listings for the /api endpoints
+
+Queries run against the indexes in content_index: filters intersect the
+prebuilt buckets, sorting walks a presorted (key, position) list, and the
+cursor is the last entry returned, so the next page starts with a bisect
+instead of re-sorting or counting an offset.
+"""
+import base64
+import json
+from bisect import bisect_left, bisect_right
+from datetime import date
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class QueryError(ValueError):
+    """A bad query parameter; the message is safe to show the client"""
+
+
+def encode_cursor(entry):
+    key, position = entry
+    raw = json.dumps([list(key), position], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key, position = json.loads(raw)
+        key = tuple(key)
+    except (ValueError, TypeError):
+        raise QueryError('invalid cursor')
+    # json.loads accepts Infinity/NaN and floats; positions are list indexes
+    if type(position) is not int or position < 0:
+        raise QueryError('invalid cursor')
+    return key, position
+
+
+def parse_limit(value, default):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise QueryError('limit must be an integer')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def parse_day(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise QueryError(f'{name} must be a YYYY-MM-DD date')
+
+
+def query_listing(index, args, filters, date_field=None, default_limit=DEFAULT_LIMIT):
+    """Return (records, next_cursor) for one page of an indexed listing
+
+    `filters` maps query parameters to bucket names in the index (e.g.
+    {'status': 'by_status'}). Supported parameters besides the filters:
+    sort=field or -field, limit, cursor, and from/to on date_field.
+    """
+    records = index['all']
+
+    sort = args.get('sort') or None
+    descending = bool(sort) and sort.startswith('-')
+    field = sort.lstrip('-') if sort else None
+    if field not in index['sorted']:
+        raise QueryError(f"cannot sort by '{field}'")
+    order = index['sorted'][field]
+
+    limit = parse_limit(args.get('limit'), default_limit)
+
+    # Records allowed by the bucket filters, by identity
+    allowed = None
+    for param, bucket in filters.items():
+        value = args.get(param)
+        if value:
+            matching = {id(record) for record in index[bucket].get(value, [])}
+            allowed = matching if allowed is None else allowed & matching
+
+    date_from = parse_day(args.get('from'), 'from')
+    date_to = parse_day(args.get('to'), 'to')
+    if (date_from or date_to) and not date_field:
+        raise QueryError('this listing has no date to filter on')
+
+    def matches(record):
+        if allowed is not None and id(record) not in allowed:
+            return False
+        if date_field:
+            day = str(record.get(date_field) or '')[:10]
+            if date_from and day < date_from:
+                return False
+            if date_to and day > date_to:
+                return False
+        return True
+
+    cursor = args.get('cursor')
+    if cursor:
+        entry = decode_cursor(cursor)
+        try:
+            start = bisect_left(order, entry) - 1 if descending else bisect_right(order, entry)
+        except TypeError:
+            raise QueryError('invalid cursor')
+    else:
+        start = len(order) - 1 if descending else 0
+    positions = range(start, -1, -1) if descending else range(start, len(order))
+
+    page = []
+    last = None
+    for i in positions:
+        record = records[order[i][1]]
+        if not matches(record):
+            continue
+        if len(page) == limit:
+            # There is at least one more match after this page
+            return page, encode_cursor(last)
+        page.append(record)
+        last = order[i]
+    return page, None
+
+
+def project(records, fields):
+    """Keep only the comma-separated `fields` of each record (all fields if empty)"""
+    names = [name for name in (fields or '').split(',') if name]
+    if not names:
+        return records
+    return [{name: record[name] for name in names if name in record} for record in records]
@@ -1,17 +1,42 @@
 """
 Main Flask Application for The Smiling Tear Foundation
 """
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, session
-from database import get_db, init_db
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, send_file, send_from_directory, session, g
+import database
+from database import get_db, migrate, close_db, storage_profile, fetch_page, next_sequence_value
+from content_store import ContentStore
+from content_index import build_program_index, build_event_index, build_blog_index
+import jobs
+from mailer import MailTransport
+import group_commit
+from group_commit import GroupCommitWriter
+from http_cache import conditional, tree_mtime
+import json_bodies
+from json_bodies import JSONBody
+from api_query import QueryError, query_listing, project
+import images
+from images import ImagePipeline
+from assets import AssetManifest
+from compression import CompressionMiddleware
+import profiling
+from profiling import RequestProfiler, phase, timed
+import metrics
+from query_log import SlowQueryLog
+import hmac
+import mimetypes
 from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import Markup, escape
 
 from flask_mail import Mail, Message
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import math
 import os
+import time
+import uuid
 from werkzeug.utils import secure_filename
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+from receipts import ReceiptRenderer
+import statements
 from io import BytesIO
 from twilio.rest import Client
 import random
@@ -46,16 +71,197 @@ TWILIO_NUMBER = "+1234567890"
 
 mail = Mail(app)
 
+# One pooled SQLite connection per request, returned to the pool on teardown
+app.teardown_appcontext(close_db)
+
+
+def check_storage_profile():
+    """Startup check: log the SQLite settings in effect and any that did not apply"""
+    active, mismatched = storage_profile()
+    # WARNING like the migration messages: Flask's default logger level hides INFO
+    app.logger.warning(f'SQLite storage profile: {active}')
+    for name, (wanted, got) in mismatched.items():
+        app.logger.warning(f'SQLite {name} is {got}, expected {wanted}')
+    return active
+
+
+# Receipt PDFs: RECEIPT_WORKERS > 0 renders in a process pool; finished
+# receipts are cached by donation_id (and on disk if RECEIPT_CACHE_DIR is set)
+app.config['RECEIPT_WORKERS'] = int(os.environ.get('RECEIPT_WORKERS', 0))
+app.config['RECEIPT_CACHE_SIZE'] = int(os.environ.get('RECEIPT_CACHE_SIZE', 256))
+app.config['RECEIPT_CACHE_DIR'] = os.environ.get('RECEIPT_CACHE_DIR')
+receipts = ReceiptRenderer(workers=app.config['RECEIPT_WORKERS'],
+                           cache_size=app.config['RECEIPT_CACHE_SIZE'],
+                           cache_dir=app.config['RECEIPT_CACHE_DIR'])
+
+# Bulk receipt / 80G statement exports built from the admin dashboard
+app.config['EXPORT_DIR'] = os.environ.get('EXPORT_DIR', 'exports')
+app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', os.cpu_count() or 1))
+
+# Background threads per process that send queued email/SMS
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+job_workers = jobs.WorkerPool(app, app.config['JOB_WORKERS'])
+
+# Group commit: donation/volunteer inserts from concurrent requests share one
+# transaction, committed after WRITE_BATCH_MAX_WAIT_MS or WRITE_BATCH_MAX_ROWS
+app.config['WRITE_BATCHING'] = os.environ.get('WRITE_BATCHING', 'false').lower() == 'true'
+app.config['WRITE_BATCH_MAX_ROWS'] = int(os.environ.get('WRITE_BATCH_MAX_ROWS', 64))
+app.config['WRITE_BATCH_MAX_WAIT_MS'] = float(os.environ.get('WRITE_BATCH_MAX_WAIT_MS', 5))
+group_writer = GroupCommitWriter(max_batch=app.config['WRITE_BATCH_MAX_ROWS'],
+                                 max_delay=app.config['WRITE_BATCH_MAX_WAIT_MS'] / 1000)
+
+
+@app.before_request
+def start_job_workers():
+    """Start this process's job workers on its first request (safe after a fork)"""
+    job_workers.ensure_started()
+
+
+# Server-Timing header with SQLite/JSON/template/PDF/SMTP time per request:
+# SERVER_TIMING=admin (admin sessions only), all or off. Admins can also send
+# `X-Profile: 1` to save a profile of the request under PROFILE_DIR
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', 'admin').lower()
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join('logs', 'profiles'))
+
+
+def is_admin_request():
+    return session.get('role') == 'admin'
+
+
+profiler = RequestProfiler(app,
+                           profile_dir=app.config['PROFILE_DIR'],
+                           server_timing=app.config['SERVER_TIMING'] in ('admin', 'all'),
+                           allow_profile=is_admin_request,
+                           allow_server_timing=(is_admin_request if app.config['SERVER_TIMING'] == 'admin'
+                                                else None))
+
+
+# Create the database or apply pending schema migrations, in every worker
+for version, description in migrate():
+    app.logger.warning(f'Applied database migration {version}: {description}')
+check_storage_profile()
+
+# Parsed data/ files, re-checked on disk at most every CONTENT_CHECK_INTERVAL seconds
+app.config['CONTENT_CHECK_INTERVAL'] = float(os.environ.get('CONTENT_CHECK_INTERVAL', 2))
+content = ContentStore('data', check_interval=app.config['CONTENT_CHECK_INTERVAL'])
+
+# Cache the rendered hero/stats/mission/programs/events/blog sections of the home page
+app.config['HOME_FRAGMENT_CACHE'] = os.environ.get('HOME_FRAGMENT_CACHE', 'true').lower() == 'true'
+
+# ETag/Last-Modified validators and Cache-Control on public pages and the JSON API
+app.config['HTTP_CACHE'] = os.environ.get('HTTP_CACHE', 'true').lower() == 'true'
+app.config['PAGE_MAX_AGE'] = int(os.environ.get('PAGE_MAX_AGE', 60))
+app.config['PAGE_STALE_WHILE_REVALIDATE'] = int(os.environ.get('PAGE_STALE_WHILE_REVALIDATE', 300))
+app.config['API_MAX_AGE'] = int(os.environ.get('API_MAX_AGE', 30))
+app.config['API_STALE_WHILE_REVALIDATE'] = int(os.environ.get('API_STALE_WHILE_REVALIDATE', 120))
+
+# /api responses are encoded (and gzipped) once per data version; API_JSON_BACKEND
+# is 'orjson' or 'json' (default: orjson when installed)
+app.config['API_JSON_BACKEND'] = os.environ.get('API_JSON_BACKEND', json_bodies.default_backend())
+app.config['API_PRECOMPRESS'] = os.environ.get('API_PRECOMPRESS', 'true').lower() == 'true'
+
+# Default page size when an /api listing is paginated (?limit=, ?cursor=, filters...)
+app.config['API_PAGE_SIZE'] = int(os.environ.get('API_PAGE_SIZE', 20))
+
+# Resized/WebP/AVIF copies of static images, made on first request and kept on disk
+app.config['IMAGE_CACHE_DIR'] = os.environ.get('IMAGE_CACHE_DIR', 'image_cache')
+app.config['IMAGE_WIDTHS'] = [int(w) for w in os.environ.get('IMAGE_WIDTHS', '320,640,960,1280,1920').split(',')]
+app.config['IMAGE_FORMATS'] = os.environ.get('IMAGE_FORMATS', 'avif,webp').split(',')
+image_pipeline = ImagePipeline(os.path.join(app.root_path, 'static'),
+                               app.config['IMAGE_CACHE_DIR'],
+                               widths=app.config['IMAGE_WIDTHS'],
+                               formats=app.config['IMAGE_FORMATS'])
+
+# Fingerprinted, precompressed copies of static/ from `python assets.py build`,
+# loaded once; without a build the plain /static/ URLs are used
+app.config['ASSET_BUILD_DIR'] = os.environ.get('ASSET_BUILD_DIR', 'static_build')
+asset_manifest = AssetManifest(os.path.join(app.root_path, app.config['ASSET_BUILD_DIR']))
+if not asset_manifest:
+    app.logger.info('No asset manifest found; serving unfingerprinted static files')
+
+# Templates only change on deploy, so their version is taken once at startup
+TEMPLATES_MTIME = tree_mtime(os.path.join(app.root_path, 'templates'))
+
 # Utility function to load JSON data
 def load_json_data(filename):
-    """Load data from JSON file"""
-    try:
-        with open(f'data/{filename}', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-    except json.JSONDecodeError:
-        return {}
+    """Load data from JSON file (served from the in-process content store)"""
+    return content.get(filename)
+
+
+def get_program_index():
+    """Slug/id lookups for programs.json, rebuilt when the file changes"""
+    return content.derived('programs', ['programs.json'], build_program_index)
+
+
+def get_event_index():
+    """Slug/id lookups and status buckets for events.json"""
+    return content.derived('events', ['events.json'], build_event_index)
+
+
+def get_blog_index():
+    """Slug/id lookups, categories and related posts for blog-posts.json"""
+    return content.derived('blog', ['blog-posts.json'], build_blog_index)
+
+
+# Data files the home page is built from
+HOME_FILES = ['config.json', 'programs.json', 'events.json', 'blog-posts.json']
+
+
+def build_home_view(config_data, programs_data, events_data, blog_data):
+    """Assemble the home page view model from its data files"""
+    return {
+        'hero': config_data.get('hero', {}),
+        'stats': config_data.get('stats', {}),
+        'mission': config_data.get('mission', {}),
+        # Featured programs (first 2)
+        'featured_programs': programs_data.get('programs', [])[:2],
+        # Upcoming events (first 3)
+        'upcoming_events': [e for e in events_data.get('events', [])
+                            if e.get('status') == 'upcoming'][:3],
+        # Latest blog posts (first 3)
+        'latest_posts': blog_data.get('posts', [])[:3],
+    }
+
+
+def data_version(filenames, templates=False):
+    """Version callable for conditional(): content-store versions of the files (and templates)"""
+    def version():
+        stamps = tuple(content.version(f) for f in filenames)
+        modified = [stamp[0] / 1e9 for stamp in stamps if stamp]
+        if templates:
+            # Pages also show current_year from the context processor
+            return ((stamps, TEMPLATES_MTIME, asset_manifest.version, datetime.now().year),
+                    max(modified + [TEMPLATES_MTIME]))
+        return stamps, max(modified, default=0)
+    return version
+
+
+def cached_page(*filenames):
+    """Conditional GET for a public page built from data files (config.json is in every page)"""
+    return conditional(data_version(('config.json',) + filenames, templates=True),
+                       max_age=app.config['PAGE_MAX_AGE'],
+                       stale_while_revalidate=app.config['PAGE_STALE_WHILE_REVALIDATE'],
+                       per_session=True)
+
+
+def cached_api(*filenames):
+    """Conditional GET for a JSON API endpoint built from data files"""
+    return conditional(data_version(filenames),
+                       max_age=app.config['API_MAX_AGE'],
+                       stale_while_revalidate=app.config['API_STALE_WHILE_REVALIDATE'])
+
+
+def get_home_view():
+    """Home page view model, rebuilt only when one of HOME_FILES changes"""
+    return content.derived('home', HOME_FILES, build_home_view)
+
+
+def get_home_sections():
+    """Rendered home page sections, re-rendered only when one of HOME_FILES changes"""
+    return content.derived(
+        'home_sections', HOME_FILES,
+        lambda *data: Markup(render_template('partials/home_sections.html', **get_home_view()))
+    )
 
 # Context processor to make data available to all templates
 @app.context_processor
@@ -69,6 +275,91 @@ def inject_global_data():
         'current_year': datetime.now().year
     }
 
+# Fingerprinted static assets
+def asset_url_for(endpoint, **values):
+    """url_for, but static files that are in the asset manifest get their fingerprinted URL"""
+    if endpoint == 'static' and asset_manifest:
+        built = asset_manifest.lookup(values.get('filename'))
+        if built is not None:
+            values['filename'] = built
+            return url_for('asset_file', **values)
+    return url_for(endpoint, **values)
+
+
+app.jinja_env.globals['url_for'] = asset_url_for
+
+
+@app.route('/assets/<path:filename>')
+def asset_file(filename):
+    """Serve a fingerprinted asset, precompressed if the client accepts it"""
+    path, encoding = asset_manifest.variant(filename, request.accept_encodings)
+    if path is None:
+        return render_template('404.html'), 404
+
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                         conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # The name changes whenever the content does
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+# Responsive images
+@app.template_global()
+def image_url(filename, width):
+    """URL of a copy of a static image at least `width` px wide (the original if it can't be resized)"""
+    info = image_pipeline.info(filename)
+    if info is None:
+        return asset_url_for('static', filename=filename)
+    return url_for('image_derivative', fmt=info['format'], width=image_pipeline.fit_width(info, width),
+                   filename=filename, v=info['version'])
+
+
+@app.template_global()
+def responsive_img(filename, alt='', sizes='100vw', **attrs):
+    """<picture> with AVIF/WebP sources and a srcset for a static image; lazy unless loading= is given"""
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    extra = ''.join(f' {name}="{escape(value)}"' for name, value in attrs.items())
+
+    info = image_pipeline.info(filename)
+    if info is None:
+        return Markup(f'<img src="{escape(asset_url_for("static", filename=filename))}" alt="{escape(alt)}"{extra}>')
+
+    def srcset(fmt):
+        return ', '.join(
+            f"{url_for('image_derivative', fmt=fmt, width=w, filename=filename, v=info['version'])} {w}w"
+            for w in image_pipeline.widths_for(info)
+        )
+
+    sources = ''.join(
+        f'<source type="{images.MIMETYPES[fmt]}" srcset="{escape(srcset(fmt))}" sizes="{escape(sizes)}">'
+        for fmt in image_pipeline.formats
+    )
+    fallback = image_url(filename, 960)
+    return Markup(
+        f'<picture>{sources}'
+        f'<img src="{escape(fallback)}" srcset="{escape(srcset(info["format"]))}" sizes="{escape(sizes)}" '
+        f'alt="{escape(alt)}"{extra}></picture>'
+    )
+
+
+@app.route('/img/<fmt>/<int:width>/<path:filename>')
+def image_derivative(fmt, width, filename):
+    """Serve (and on first request, generate) a resized copy of a static image"""
+    path = image_pipeline.derivative(filename, width, fmt)
+    if path is None:
+        return render_template('404.html'), 404
+
+    response = send_file(path, mimetype=images.MIMETYPES[fmt], conditional=True)
+    if request.args.get('v'):
+        # Versioned URLs change whenever the source image does
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 # Template filters
 @app.template_filter('format_date')
 def format_date(date_string):
@@ -99,29 +390,13 @@ def internal_error(error):
 # ============================================================================
 
 @app.route('/')
+@cached_page(*HOME_FILES)
 def index():
     """Home page"""
-    config_data = load_json_data('config.json')
-    programs_data = load_json_data('programs.json')
-    events_data = load_json_data('events.json')
-    blog_data = load_json_data('blog-posts.json')
-    
-    # Get featured programs (first 2)
-    featured_programs = programs_data.get('programs', [])[:2]
-    
-    # Get upcoming events (first 3)
-    upcoming_events = [e for e in events_data.get('events', []) if e.get('status') == 'upcoming'][:3]
+    if app.config['HOME_FRAGMENT_CACHE']:
+        return render_template('index.html', home_sections=get_home_sections())
     
-    # Get latest blog posts (first 3)
-    latest_posts = blog_data.get('posts', [])[:3]
-    
-    return render_template('index.html',
-                         hero=config_data.get('hero', {}),
-                         stats=config_data.get('stats', {}),
-                         mission=config_data.get('mission', {}),
-                         featured_programs=featured_programs,
-                         upcoming_events=upcoming_events,
-                         latest_posts=latest_posts)
+    return render_template('index.html', **get_home_view())
 
 
 # signup route
@@ -168,6 +443,7 @@ def signup():
 
 
 @app.route('/about')
+@cached_page('team-members.json')
 def about():
     """About page"""
     config_data = load_json_data('config.json')
@@ -179,6 +455,7 @@ def about():
 
 
 @app.route('/programs')
+@cached_page('programs.json')
 def programs():
     """Programs listing page"""
     programs_data = load_json_data('programs.json')
@@ -187,10 +464,10 @@ def programs():
 
 
 @app.route('/programs/<slug>')
+@cached_page('programs.json')
 def program_detail(slug):
     """Single program detail page"""
-    programs_data = load_json_data('programs.json')
-    program = next((p for p in programs_data.get('programs', []) if p['slug'] == slug), None)
+    program = get_program_index()['by_slug'].get(slug)
     
     if not program:
         return render_template('404.html'), 404
@@ -201,14 +478,14 @@ def program_detail(slug):
 
 
 @app.route('/events')
+@cached_page('events.json')
 def events():
     """Events listing page"""
-    events_data = load_json_data('events.json')
-    all_events = events_data.get('events', [])
+    events_by_status = get_event_index()['by_status']
     
     # Separate upcoming and past events
-    upcoming = [e for e in all_events if e.get('status') == 'upcoming']
-    past = [e for e in all_events if e.get('status') == 'past']
+    upcoming = events_by_status.get('upcoming', [])
+    past = events_by_status.get('past', [])
     
     return render_template('events.html',
                          upcoming_events=upcoming,
@@ -216,10 +493,10 @@ def events():
 
 
 @app.route('/events/<slug>')
+@cached_page('events.json')
 def event_detail(slug):
     """Single event detail page"""
-    events_data = load_json_data('events.json')
-    event = next((e for e in events_data.get('events', []) if e['slug'] == slug), None)
+    event = get_event_index()['by_slug'].get(slug)
     
     if not event:
         return render_template('404.html'), 404
@@ -228,37 +505,39 @@ def event_detail(slug):
 
 
 @app.route('/blog')
+@cached_page('blog-posts.json')
 def blog():
     """Blog listing page"""
-    blog_data = load_json_data('blog-posts.json')
+    blog_index = get_blog_index()
     
     # Filter by category if provided
     category = request.args.get('category')
-    posts = blog_data.get('posts', [])
+    posts = blog_index['all']
     
     if category:
-        posts = [p for p in posts if p.get('category') == category]
+        posts = blog_index['by_category'].get(category, [])
     
     return render_template('blog.html', posts=posts, selected_category=category)
 
 
 @app.route('/blog/<slug>')
+@cached_page('blog-posts.json')
 def blog_detail(slug):
     """Single blog post detail page"""
-    blog_data = load_json_data('blog-posts.json')
-    post = next((p for p in blog_data.get('posts', []) if p['slug'] == slug), None)
+    blog_index = get_blog_index()
+    post = blog_index['by_slug'].get(slug)
     
     if not post:
         return render_template('404.html'), 404
     
-    # Get related posts (same category, exclude current)
-    related_posts = [p for p in blog_data.get('posts', []) 
-                    if p.get('category') == post.get('category') and p['id'] != post['id']][:3]
+    # Related posts (same category, exclude current) are precomputed per slug
+    related_posts = blog_index['related'].get(slug, [])
     
     return render_template('blog_detail.html', post=post, related_posts=related_posts)
 
 
 @app.route('/contact', methods=['GET', 'POST'])
+@cached_page()
 def contact():
     """Contact page with form submission"""
     if request.method == 'POST':
@@ -270,12 +549,12 @@ def contact():
         # Save to JSON file (or database)
         save_contact_submission(name, email, phone, message)
         
-        # Send email notification
+        # Queue email notification
         try:
-            send_contact_email(name, email, phone, message)
+            jobs.enqueue('contact_email', {'name': name, 'email': email, 'phone': phone, 'message': message})
             flash('Thank you for contacting us! We will get back to you soon.', 'success')
         except Exception as e:
-            app.logger.error(f'Error sending email: {str(e)}')
+            app.logger.error(f'Error queueing email: {str(e)}')
             flash('Your message has been received, but there was an issue with email notification.', 'warning')
         
         return redirect(url_for('contact'))
@@ -284,6 +563,7 @@ def contact():
 
 
 @app.route('/volunteer', methods=['GET', 'POST'])
+@cached_page()
 def volunteer():
     """Volunteer page with application form"""
     config_data = load_json_data('config.json')
@@ -299,12 +579,12 @@ def volunteer():
         # Save volunteer application
         save_volunteer_application(name, email, phone, city, interests, message)
         
-        # Send confirmation email
+        # Queue confirmation email
         try:
-            send_volunteer_email(name, email)
+            jobs.enqueue('volunteer_email', {'name': name, 'email': email})
             flash('Thank you for your interest in volunteering! We will contact you soon.', 'success')
         except Exception as e:
-            app.logger.error(f'Error sending email: {str(e)}')
+            app.logger.error(f'Error queueing email: {str(e)}')
             flash('Your application has been received!', 'success')
         
         return redirect(url_for('volunteer'))
@@ -315,6 +595,7 @@ def volunteer():
 
 
 @app.route('/donate', methods=['GET', 'POST'])
+@cached_page()
 def donate():
     """Donation page"""
     config_data = load_json_data('config.json')
@@ -331,45 +612,24 @@ def donate():
         payment_status = request.form.get('payment_status', 'success')
 
         # Save donation (your existing logic)
-        donation_id = save_donation(amount, program, name, email, phone, is_anonymous)
+        donation_id, transaction_id = save_donation(amount, program, name, email, phone, is_anonymous)
 
         if payment_status == 'success':
-            # Generate receipt PDF in memory
-            buffer = BytesIO()
-            c = canvas.Canvas(buffer, pagesize=letter)
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(200, 750, "Donation Receipt")
-            c.setFont("Helvetica", 12)
-            
-            c.drawString(50, 720, f"Receipt ID: {donation_id}")
-            c.drawString(50, 700, f"Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-            c.drawString(50, 680, f"Name: {name if not is_anonymous else 'Anonymous'}")
-            c.drawString(50, 660, f"Email: {email}")
-            c.drawString(50, 640, f"Phone: {phone}")
-            c.drawString(50, 620, f"Program: {program}")
-            c.drawString(50, 600, f"Amount Donated: ₹{amount}")
-            
-            c.line(50, 580, 550, 580)
-            c.setFont("Helvetica-Bold", 12)
-            c.drawString(50, 560, "Organization Details:")
-            c.setFont("Helvetica", 11)
-            c.drawString(50, 540, "Smiling Tears Foundation")
-            c.drawString(50, 525, "Reg. No: 1234")
-            c.drawString(50, 510, "Address: Laxmi Nagar, Delhi")
-            c.drawString(50, 495, "Contact: 9009664469")
-            c.drawString(50, 480, "Email: smilingtearsfoundation@gmail.com")
-            
-            c.showPage()
-            c.save()
-            buffer.seek(0)
-
-            # Send file as downloadable PDF
-            return send_file(
-                buffer,
-                as_attachment=True,
-                download_name=f"Donation_Receipt_{donation_id}.pdf",
-                mimetype='application/pdf'
-            )
+            with phase('pdf'):
+                pdf = receipts.render({
+                    'donation_id': donation_id,
+                    'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                    'name': name if not is_anonymous else 'Anonymous',
+                    'email': email,
+                    'phone': phone,
+                    'program': program,
+                    'amount': amount,
+                })
+
+            # Let this visitor download the receipt again later
+            session['receipts'] = (session.get('receipts', []) + [donation_id])[-10:]
+
+            return send_receipt(pdf, donation_id)
         else:
             flash('Payment was unsuccessful. Please try again.', 'danger')
             return redirect(url_for('donate'))
@@ -381,6 +641,48 @@ def donate():
     )
 
 
+@app.route('/donate/receipt/<donation_id>')
+def donation_receipt(donation_id):
+    """Re-download a receipt (own donations from this session, or any for admins)"""
+    if donation_id not in session.get('receipts', []) and session.get('role') != 'admin':
+        return render_template('404.html'), 404
+
+    pdf = receipts.cached(donation_id)
+    if pdf is None:
+        conn = get_db()
+        donation = conn.execute("SELECT * FROM donations WHERE donation_id=?", (donation_id,)).fetchone()
+        if not donation:
+            return render_template('404.html'), 404
+        with phase('pdf'):
+            pdf = receipts.render(receipt_from_donation(donation))
+
+    return send_receipt(pdf, donation_id)
+
+
+def receipt_from_donation(donation):
+    """Receipt fields for a row of the donations table"""
+    timestamp = datetime.fromisoformat(donation['timestamp'])
+    return {
+        'donation_id': donation['donation_id'],
+        'date': timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+        'name': donation['donor_name'],
+        'email': donation['donor_email'],
+        'phone': donation['donor_phone'],
+        'program': donation['program'],
+        'amount': donation['amount'],
+    }
+
+
+def send_receipt(pdf, donation_id):
+    """Send receipt PDF bytes as a download"""
+    return send_file(
+        BytesIO(pdf),
+        as_attachment=True,
+        download_name=f"Donation_Receipt_{donation_id}.pdf",
+        mimetype='application/pdf'
+    )
+
+
 # ============================================================================
 # API ROUTES 
 # ============================================================================
@@ -442,18 +744,13 @@ def logout():
 
 # SEND OTP 
 
-def send_otp(phone):
-    otp = random.randint(100000, 999999)
-
-    client = Client(TWILIO_SID, TWILIO_AUTH)
-    client.messages.create(
-        body=f"Your Smiling Tears password reset OTP is {otp}",
-        from_=TWILIO_NUMBER,
-        to=f"+91{phone}"  # assuming India numbers
+@jobs.handler('otp_sms', sensitive=('otp',))
+def send_otp(phone, otp):
+    transports['sms'](
+        to=f"+91{phone}",  # assuming India numbers
+        body=f"Your Smiling Tears password reset OTP is {otp}"
     )
 
-    return otp
-
 
 # otp verification 
 
@@ -494,9 +791,10 @@ def forgot_password():
         session['reset_email'] = email
         session['reset_phone'] = user['phone']  # stored during volunteer approval
 
-        # send OTP
-        otp = send_otp(user['phone'])
+        # send OTP (delivered by a background job worker)
+        otp = random.randint(100000, 999999)
         session['reset_otp'] = str(otp)
+        jobs.enqueue('otp_sms', {'phone': user['phone'], 'otp': otp})
 
         flash("OTP sent to your registered mobile number.", "success")
         return redirect(url_for('verify_otp'))
@@ -539,18 +837,76 @@ def reset_password():
 
 
 
+# Paginated /api listings: the index behind each one, the key its records are
+# returned under, and which query parameters filter on which index bucket
+API_LISTINGS = {
+    'programs': {
+        'index': get_program_index,
+        'key': 'programs',
+        'filters': {'category': 'by_category'},
+        'date_field': None,
+    },
+    'events': {
+        'index': get_event_index,
+        'key': 'events',
+        'filters': {'status': 'by_status', 'category': 'by_category', 'program': 'by_program'},
+        'date_field': 'date',
+    },
+    'blog': {
+        'index': get_blog_index,
+        'key': 'posts',
+        'filters': {'category': 'by_category', 'program': 'by_program'},
+        'date_field': 'date',
+    },
+}
+
+# Any of these turns a plain /api listing request into a paginated query
+API_QUERY_PARAMS = {'limit', 'cursor', 'fields', 'sort', 'from', 'to', 'category', 'program'}
+
+
+def wants_listing_query():
+    return not API_QUERY_PARAMS.isdisjoint(request.args.keys())
+
+
+def api_listing(name):
+    """One page of an /api listing, e.g. /api/events?status=upcoming&sort=-date&limit=10&fields=title,date"""
+    listing = API_LISTINGS[name]
+    try:
+        records, next_cursor = query_listing(listing['index'](), request.args,
+                                             listing['filters'], listing['date_field'],
+                                             default_limit=app.config['API_PAGE_SIZE'])
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    body = {listing['key']: project(records, request.args.get('fields')), 'next_cursor': next_cursor}
+    return app.response_class(json_bodies.dumps(body, app.config['API_JSON_BACKEND']),
+                              mimetype='application/json')
+
+
+def api_body(name, filenames, builder):
+    """Encoded JSON body for builder(*parsed_files), re-encoded only when a file changes"""
+    return content.derived(
+        f'api:{name}', filenames,
+        lambda *data: JSONBody(builder(*data),
+                               backend=app.config['API_JSON_BACKEND'],
+                               compress=app.config['API_PRECOMPRESS'])
+    )
+
+
 @app.route('/api/programs')
+@cached_api('programs.json')
 def api_programs():
     """API endpoint for programs"""
-    programs_data = load_json_data('programs.json')
-    return jsonify(programs_data)
+    if wants_listing_query():
+        return api_listing('programs')
+    return api_body('programs', ['programs.json'], lambda programs_data: programs_data).response()
 
 
 @app.route('/api/programs/<program_id>')
+@cached_api('programs.json')
 def api_program_detail(program_id):
     """API endpoint for single program"""
-    programs_data = load_json_data('programs.json')
-    program = next((p for p in programs_data.get('programs', []) if p['id'] == program_id), None)
+    program = get_program_index()['by_id'].get(program_id)
     
     if not program:
         return jsonify({'error': 'Program not found'}), 404
@@ -559,25 +915,33 @@ def api_program_detail(program_id):
 
 
 @app.route('/api/events')
+@cached_api('events.json')
 def api_events():
     """API endpoint for events"""
-    events_data = load_json_data('events.json')
+    if wants_listing_query():
+        return api_listing('events')
+    
+    event_index = get_event_index()
     
-    # Filter by status if provided
+    # Filter by status if provided; unknown statuses share one empty body
     status = request.args.get('status')
-    events = events_data.get('events', [])
+    if status and status not in event_index['by_status']:
+        status = '-'
     
-    if status:
-        events = [e for e in events if e.get('status') == status]
+    def build(events_data):
+        index = get_event_index()
+        if not status:
+            return {'events': index['all']}
+        return {'events': index['by_status'].get(status, [])}
     
-    return jsonify({'events': events})
+    return api_body(f'events:{status or ""}', ['events.json'], build).response()
 
 
 @app.route('/api/events/<event_id>')
+@cached_api('events.json')
 def api_event_detail(event_id):
     """API endpoint for single event"""
-    events_data = load_json_data('events.json')
-    event = next((e for e in events_data.get('events', []) if e['id'] == event_id), None)
+    event = get_event_index()['by_id'].get(event_id)
     
     if not event:
         return jsonify({'error': 'Event not found'}), 404
@@ -586,17 +950,19 @@ def api_event_detail(event_id):
 
 
 @app.route('/api/blog')
+@cached_api('blog-posts.json')
 def api_blog():
     """API endpoint for blog posts"""
-    blog_data = load_json_data('blog-posts.json')
-    return jsonify(blog_data)
+    if wants_listing_query():
+        return api_listing('blog')
+    return api_body('blog', ['blog-posts.json'], lambda blog_data: blog_data).response()
 
 
 @app.route('/api/stats')
+@cached_api('config.json')
 def api_stats():
     """API endpoint for site statistics"""
-    config_data = load_json_data('config.json')
-    return jsonify(config_data.get('stats', {}))
+    return api_body('stats', ['config.json'], lambda config_data: config_data.get('stats', {})).response()
 
 
 # ============================================================================
@@ -616,80 +982,79 @@ def get_all_donations():
 
 def save_contact_submission(name, email, phone, message):
     """Save contact form submission"""
-    submission = {
-        'id': datetime.now().strftime('%Y%m%d%H%M%S'),
-        'name': name,
-        'email': email,
-        'phone': phone,
-        'message': message,
-        'timestamp': datetime.now().isoformat(),
-        'status': 'new'
-    }
-    
-    # Save to JSON file
     try:
-        submissions_file = 'data/contact_submissions.json'
-        if os.path.exists(submissions_file):
-            with open(submissions_file, 'r') as f:
-                data = json.load(f)
-        else:
-            data = {'submissions': []}
-        
-        data['submissions'].append(submission)
-        
-        with open(submissions_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        conn = get_db()
+        conn.execute("""
+            INSERT INTO contact_submissions (name, email, phone, message, timestamp, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, email, phone, message, datetime.now().isoformat(), 'new'))
+        conn.commit()
     except Exception as e:
         app.logger.error(f'Error saving contact submission: {str(e)}')
 
 
-def save_volunteer_application(name, email, phone, city, interests, message):
+def commit_write(work):
+    """Run work(conn) and commit it, through the group-commit writer when enabled"""
+    if app.config['WRITE_BATCHING']:
+        return group_writer.submit(work)
+
     conn = get_db()
-    cur = conn.cursor()
+    result = work(conn)
+    conn.commit()
+    return result
 
-    vol_id = generate_volunteer_id()
 
-    cur.execute("""
-        INSERT INTO volunteer_applications
-        (id, name, email, phone, city, interests, message, timestamp, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (vol_id, name, email, phone, city, ",".join(interests),
-          message, datetime.now().isoformat(), "pending"))
+def save_volunteer_application(name, email, phone, city, interests, message):
+    timestamp = datetime.now().isoformat()
 
-    conn.commit()
-    return vol_id
+    def insert(conn):
+        cur = conn.cursor()
+
+        vol_id = generate_volunteer_id(conn)
+
+        cur.execute("""
+            INSERT INTO volunteer_applications
+            (id, name, email, phone, city, interests, message, timestamp, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (vol_id, name, email, phone, city, ",".join(interests),
+              message, timestamp, "pending"))
+        return vol_id
+
+    return commit_write(insert)
 
 
 
 
 def save_donation(amount, program, name, email, phone, is_anonymous):
-    conn = get_db()
-    cur = conn.cursor()
+    timestamp = datetime.now().isoformat()
 
-    donation_id = datetime.now().strftime('%Y%m%d%H%M%S')
-    transaction_id = "TXN" + donation_id
-
-    cur.execute("""
-        INSERT INTO donations
-        (donation_id, transaction_id, amount, program, donor_name, donor_email, donor_phone, is_anonymous, timestamp, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        donation_id,
-        transaction_id,
-        amount,
-        program,
-        name if not is_anonymous else "Anonymous",
-        email,
-        phone,
-        1 if is_anonymous else 0,
-        datetime.now().isoformat(),
-        "success"
-    ))
+    def insert(conn):
+        cur = conn.cursor()
 
-    conn.commit()
-    conn.close()
+        donation_id = generate_donation_id(conn)
+        transaction_id = "TXN" + donation_id
 
-    return donation_id, transaction_id
+        cur.execute("""
+            INSERT INTO donations
+            (donation_id, transaction_id, amount, program, donor_name, donor_email, donor_phone, is_anonymous, timestamp, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            donation_id,
+            transaction_id,
+            amount,
+            program,
+            name if not is_anonymous else "Anonymous",
+            email,
+            phone,
+            1 if is_anonymous else 0,
+            timestamp,
+            "success"
+        ))
+        return donation_id, transaction_id
+
+    result = commit_write(insert)
+    count_donation(program, amount)
+    return result
 
 
 
@@ -790,6 +1155,79 @@ def delete_user(email):
 
 
 
+# Rows per page on the admin dashboard
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+
+# Dashboard sections: source table, fixed conditions, allowed filters, row template
+ADMIN_SECTIONS = {
+    'volunteers': {
+        'table': 'volunteer_applications',
+        'where': [],
+        'filters': ['status', 'date'],
+        'rows': 'partials/admin_volunteer_rows.html',
+    },
+    'volunteer_accounts': {
+        'table': 'users',
+        'where': ["role = 'volunteer'"],
+        'filters': [],
+        'rows': 'partials/admin_user_rows.html',
+    },
+    'manager_accounts': {
+        'table': 'users',
+        'where': ["role = 'manager'"],
+        'filters': [],
+        'rows': 'partials/admin_user_rows.html',
+    },
+    'contacts': {
+        'table': 'contact_submissions',
+        'where': [],
+        'filters': ['status', 'date'],
+        'rows': 'partials/admin_contact_rows.html',
+    },
+    'donations': {
+        'table': 'donations',
+        'where': [],
+        'filters': ['status', 'date', 'program'],
+        'rows': 'partials/admin_donation_rows.html',
+    },
+}
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD query parameter, or None if missing/invalid"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def admin_section_filters(section, args):
+    """Build SQL conditions for a dashboard section from the query string"""
+    where = list(section['where'])
+    params = []
+
+    if 'status' in section['filters'] and args.get('status'):
+        where.append('status = ?')
+        params.append(args['status'])
+
+    if 'program' in section['filters'] and args.get('program'):
+        where.append('program = ?')
+        params.append(args['program'])
+
+    if 'date' in section['filters']:
+        # timestamps are ISO strings, so date bounds compare lexically
+        date_from = parse_date(args.get('from'))
+        date_to = parse_date(args.get('to'))
+        if date_from:
+            where.append('timestamp >= ?')
+            params.append(date_from.isoformat())
+        if date_to:
+            where.append('timestamp < ?')
+            params.append((date_to + timedelta(days=1)).isoformat())
+
+    return where, params
+
+
 # admin dashboard 
 
 @app.route('/admin/dashboard')
@@ -798,53 +1236,129 @@ def admin_dashboard():
         flash("Access denied!", "error")
         return redirect(url_for('login'))
 
-    conn = get_db()
-    cur = conn.cursor()
+    # Each section fetches its own rows from admin_dashboard_section
+    return render_template("admin_dashboard.html",
+                           exports=list_exports(),
+                           current_fy=current_financial_year())
 
-    cur.execute("SELECT * FROM volunteer_applications")
-    volunteer_apps = cur.fetchall()
 
-    cur.execute("SELECT * FROM users")
-    users = cur.fetchall()
+@app.route('/admin/dashboard/<name>')
+def admin_dashboard_section(name):
+    """One page of rows for a dashboard section, rendered as table rows"""
+    if session.get('role') != 'admin':
+        return 'Access denied', 403
 
-    cur.execute("SELECT * FROM donations ORDER BY id DESC")
-    donations = cur.fetchall()
+    section = ADMIN_SECTIONS.get(name)
+    if not section:
+        return 'Unknown section', 404
 
-    conn.close()
+    cursor = request.args.get('cursor', type=int)
+    where, params = admin_section_filters(section, request.args)
+
+    rows, next_cursor = fetch_page(get_db(), section['table'], where, params,
+                                   cursor=cursor, limit=ADMIN_PAGE_SIZE)
+
+    response = app.make_response(render_template(section['rows'], rows=rows, first_page=cursor is None))
+    response.headers['X-Next-Cursor'] = '' if next_cursor is None else str(next_cursor)
+    return response
 
-    return render_template(
-        "admin_dashboard.html",
-        volunteer_apps=volunteer_apps,
-        users=users,
-        donations=donations
-    )
 
 
+# bulk receipt / 80G statement exports
+
+def current_financial_year():
+    """Start year of the financial year (April-March) that has most recently ended"""
+    today = datetime.now()
+    return today.year - 1 if today.month >= 4 else today.year - 2
+
+
+def list_exports():
+    """Finished export archives, newest first"""
+    export_dir = app.config['EXPORT_DIR']
+    if not os.path.isdir(export_dir):
+        return []
+    names = [n for n in os.listdir(export_dir) if n.endswith('.zip') and not n.startswith('.')]
+    return sorted(names, key=lambda n: os.path.getmtime(os.path.join(export_dir, n)), reverse=True)
+
+
+@jobs.handler('export_donations')
+def export_donations(kind, fy):
+    """Render a financial year's statements or receipts into EXPORT_DIR"""
+    start, end, label = statements.financial_year(fy)
+    name = f"{kind}-{label}.zip"
+    # Hidden until complete (list_exports() skips dot-files), and unique so two
+    # runs of the same export never write one file
+    tmp_path = os.path.join(app.config['EXPORT_DIR'], f".{os.getpid()}-{uuid.uuid4().hex[:8]}-{name}")
+
+    try:
+        result = statements.export(
+            kind, start, end, tmp_path, label=label,
+            workers=app.config['EXPORT_WORKERS'],
+            report=lambda p: app.logger.warning(f"Export {name}: {p['files']} files, {p['per_second']:.1f}/s"),
+            report_every=500,
+        )
+        os.replace(tmp_path, os.path.join(app.config['EXPORT_DIR'], name))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    app.logger.warning(f"Export {name} finished: {result['files']} files in {result['seconds']:.1f}s")
+
+
+@app.route('/admin/export', methods=['POST'])
+def admin_export():
+    if session.get('role') != 'admin':
+        flash("Access denied!", "error")
+        return redirect(url_for('login'))
+
+    kind = request.form.get('kind')
+    fy = request.form.get('fy', type=int)
+    if kind not in ('statements', 'receipts') or not fy:
+        flash("Choose an export type and financial year.", "error")
+        return redirect(url_for('admin_dashboard'))
+
+    jobs.enqueue('export_donations', {'kind': kind, 'fy': fy}, max_attempts=1)
+    flash("Export started. It will appear under Exports when finished.", "success")
+    return redirect(url_for('admin_dashboard'))
+
+
+@app.route('/admin/exports/<path:filename>')
+def admin_export_download(filename):
+    if session.get('role') != 'admin':
+        flash("Access denied!", "error")
+        return redirect(url_for('login'))
+
+    return send_from_directory(os.path.abspath(app.config['EXPORT_DIR']), filename, as_attachment=True)
+
 
 # id- generator 
 
-def generate_volunteer_id():
-    year = datetime.now().year % 100          # last 2 digits of year
-    file_path = 'data/volunteer_applications.json'
+# IDs come from the sequences table, so they are allocated in O(1) and are
+# unique across gunicorn workers. The allocation commits with the caller's
+# insert.
 
-    # Load existing data
-    if os.path.exists(file_path):
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-    else:
-        data = {'applications': []}
+def generate_volunteer_id(conn):
+    year = datetime.now().year % 100          # last 2 digits of year
 
-    # Count how many volunteers exist for the current year
-    count = sum(1 for v in data['applications']
-                if str(v['id']).startswith(str(year)))
+    def existing_this_year(conn):
+        # Only runs once per year, to continue after IDs issued before the sequence existed
+        return conn.execute("SELECT COUNT(*) FROM volunteer_applications WHERE CAST(id AS TEXT) LIKE ?",
+                            (f"{year}%",)).fetchone()[0]
 
     # new sequence
-    new_seq = count + 1
+    new_seq = next_sequence_value(conn, f"volunteer-{year}", seed=existing_this_year)
 
     # final id: example -> 25 + 1 => 251
     return int(f"{year}{new_seq}")
 
 
+def generate_donation_id(conn):
+    """Time-ordered donation ID: YYYYmmddHHMMSS plus a global sequence number"""
+    seq = next_sequence_value(conn, "donation")
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}{seq:06d}"
+
+
+@jobs.handler('contact_email')
 def send_contact_email(name, email, phone, message):
     """Send email notification for contact form"""
     if not app.config.get('MAIL_USERNAME'):
@@ -864,9 +1378,10 @@ Message:
 {message}
         '''
     )
-    mail.send(msg)
+    transports['mail'](msg)
 
 
+@jobs.handler('volunteer_email')
 def send_volunteer_email(name, email):
     """Send confirmation email to volunteer"""
     if not app.config.get('MAIL_USERNAME'):
@@ -888,7 +1403,224 @@ Best regards,
 The Smiling Tear Foundation Team
         '''
     )
-    mail.send(msg)
+    transports['mail'](msg)
+
+
+def send_sms_twilio(to, body):
+    """Send an SMS through Twilio"""
+    client = Client(TWILIO_SID, TWILIO_AUTH)
+    client.messages.create(body=body, from_=TWILIO_NUMBER, to=to)
+
+
+# Warm SMTP connections shared by the job workers of this process
+app.config['MAIL_POOL_SIZE'] = int(os.environ.get('MAIL_POOL_SIZE', 2))
+app.config['MAIL_IDLE_TIMEOUT'] = float(os.environ.get('MAIL_IDLE_TIMEOUT', 60))
+mail_transport = MailTransport(app,
+                               pool_size=app.config['MAIL_POOL_SIZE'],
+                               idle_timeout=app.config['MAIL_IDLE_TIMEOUT'])
+
+# Outbound transports used by the job handlers; tests can swap in
+# in-process fakes, e.g. transports['mail'] = sent_messages.append
+transports = {
+    'mail': timed('mail')(mail_transport.send),
+    'sms': send_sms_twilio,
+}
+
+
+@jobs.handler('mail_message')
+def send_mail_message(subject, recipients, body):
+    """Send a single plain-text email"""
+    transports['mail'](Message(subject=subject, recipients=recipients, body=body))
+
+
+@jobs.handler('mail_batch')
+def send_mail_batch(messages):
+    """Send a batch of plain-text emails over one SMTP session
+
+    Messages that fail are re-queued individually so they get their own
+    retries without resending the rest of the batch.
+    """
+    if not app.config.get('MAIL_USERNAME'):
+        return
+
+    with phase('mail'):
+        failed = mail_transport.send_batch(
+            [Message(subject=m['subject'], recipients=m['recipients'], body=m['body']) for m in messages]
+        )
+    for msg in failed:
+        jobs.enqueue('mail_message', {'subject': msg.subject, 'recipients': msg.recipients, 'body': msg.body})
+
+
+def queue_mailing(subject, body, recipients, batch_size=100):
+    """Queue the same email to many recipients, one SMTP session per batch"""
+    for start in range(0, len(recipients), batch_size):
+        jobs.enqueue('mail_batch', {'messages': [
+            {'subject': subject, 'recipients': [r], 'body': body}
+            for r in recipients[start:start + batch_size]
+        ]})
+
+
+# ============================================================================
+# SLOW QUERY LOG
+# ============================================================================
+
+# Request statements slower than SLOW_QUERY_MS go to SLOW_QUERY_LOG (redacted,
+# with their query plan); `python query_log.py report` summarizes the log.
+# At SLOW_QUERY_LOG_MAX_BYTES the log is moved to <log>.1 and restarted.
+# An empty SLOW_QUERY_LOG turns it off.
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 50))
+app.config['SLOW_QUERY_LOG'] = os.environ.get('SLOW_QUERY_LOG', os.path.join('logs', 'slow_queries.log'))
+app.config['SLOW_QUERY_EXPLAIN'] = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+app.config['SLOW_QUERY_LOG_MAX_BYTES'] = int(os.environ.get('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+if app.config['SLOW_QUERY_LOG']:
+    database.query_hooks.append(SlowQueryLog(app.config['SLOW_QUERY_LOG'],
+                                             threshold_ms=app.config['SLOW_QUERY_MS'],
+                                             explain=app.config['SLOW_QUERY_EXPLAIN'],
+                                             max_bytes=app.config['SLOW_QUERY_LOG_MAX_BYTES'],
+                                             logger=app.logger))
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+# Prometheus metrics at /metrics. Under gunicorn, point METRICS_DIR at a
+# directory emptied before the server starts, so a scrape of any worker
+# covers all of them. Donation totals are not public: scrapes must send
+# "Authorization: Bearer <METRICS_TOKEN>", and without a token configured
+# only clients on this host (loopback) are answered.
+app.config['METRICS'] = os.environ.get('METRICS', 'true').lower() == 'true'
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR')
+app.config['METRICS_FLUSH_INTERVAL'] = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+metrics_registry = metrics.Registry(app.config['METRICS_DIR'] if app.config['METRICS'] else None,
+                                    flush_interval=app.config['METRICS_FLUSH_INTERVAL'])
+
+request_latency = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Time to build a response, by endpoint', ['endpoint', 'method'])
+requests_total = metrics_registry.counter(
+    'http_requests_total', 'Responses by endpoint and status code', ['endpoint', 'method', 'status'])
+query_latency = metrics_registry.histogram(
+    'sqlite_query_duration_seconds', 'SQLite statements run for requests, by operation', ['operation'])
+phase_latency = metrics_registry.histogram(
+    'app_phase_duration_seconds', 'JSON data loading, template, receipt PDF and SMTP time', ['phase'])
+donations_total = metrics_registry.counter(
+    'donations_total', 'Donations saved, by program', ['program'])
+donation_amount_total = metrics_registry.counter(
+    'donation_amount_total', 'Sum of donated amounts in rupees, by program', ['program'])
+metrics_registry.counter_callback(
+    'content_cache_lookups_total', 'data/ file lookups served from memory (hit) or parsed (miss, reload)',
+    lambda: {(result,): content.stats()[key] for result, key in
+             (('hit', 'hits'), ('miss', 'misses'), ('reload', 'reloads'))}, ['result'])
+metrics_registry.gauge(
+    'job_queue_depth', 'Background email/SMS jobs by status',
+    lambda: {(status,): count for status, count in jobs.queue_depth().items()}, ['status'])
+pool_wait = metrics_registry.histogram(
+    'db_pool_wait_seconds', 'Time requests waited for a pooled SQLite connection (0 when one was free)',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+metrics_registry.process_gauge(
+    'db_pool_connections', 'Pooled SQLite connections open in running workers, by state',
+    lambda: {(state,): database.pool_stats()[state] for state in ('in_use', 'idle')}, ['state'])
+metrics_registry.process_gauge(
+    'db_pool_max_connections', 'Pool size limit summed over running workers',
+    lambda: database.pool_stats()['max_size'])
+write_batch_size = metrics_registry.histogram(
+    'db_write_batch_size', 'Donation/volunteer inserts committed together by the group-commit writer',
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+write_commit_latency = metrics_registry.histogram(
+    'db_write_batch_commit_seconds', 'Time to run and commit one group-commit batch')
+metrics_registry.process_gauge(
+    'db_write_queue_pending', 'Inserts waiting for the group-commit writer in running workers',
+    lambda: group_writer.stats()['pending'])
+
+
+# The program choices on the donation form; any other value is counted as "other"
+# so a crafted form post cannot create new label values
+DONATION_FORM_PROGRAMS = {'general', 'education', 'healthcare', 'skill-development', 'emergency'}
+
+
+def count_donation(program, amount):
+    """Count a saved donation under its program"""
+    known = program in DONATION_FORM_PROGRAMS or program in get_program_index()['by_slug']
+    label = program if known else 'other'
+    donations_total.inc(program=label)
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return
+    # The amount comes from the public form: a nan or inf would stick in this
+    # worker's snapshot for good, and a negative one reads as a counter reset
+    if math.isfinite(amount) and amount > 0:
+        donation_amount_total.inc(amount, program=label)
+
+
+def observe_query(sql, params, seconds):
+    operation = sql.split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+    query_latency.observe(seconds, operation=operation)
+
+
+def observe_write_batch(size, seconds):
+    write_batch_size.observe(size)
+    write_commit_latency.observe(seconds)
+
+
+def observe_phase(name, seconds):
+    # SQLite time is in sqlite_query_duration_seconds
+    if name != 'db':
+        phase_latency.observe(seconds, phase=name)
+
+
+if app.config['METRICS']:
+    database.query_hooks.append(observe_query)
+    database.acquire_hooks.append(pool_wait.observe)
+    group_commit.commit_hooks.append(observe_write_batch)
+    profiling.phase_hooks.append(observe_phase)
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        if 'metrics_started' in g:
+            endpoint = request.endpoint or 'unmatched'
+            request_latency.observe(time.perf_counter() - g.metrics_started,
+                                    endpoint=endpoint, method=request.method)
+            requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+            metrics_registry.maybe_flush()
+        return response
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text format, for every worker of this deployment"""
+    if not app.config['METRICS']:
+        return render_template('404.html'), 404
+    token = app.config['METRICS_TOKEN']
+    if token:
+        allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    else:
+        allowed = request.remote_addr in ('127.0.0.1', '::1')
+    if not allowed:
+        return app.response_class('Unauthorized\n', status=401, mimetype='text/plain')
+    return app.response_class(metrics_registry.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+# ============================================================================
+# RESPONSE COMPRESSION
+# ============================================================================
+
+# gzip/brotli for HTML and JSON responses of at least COMPRESSION_MIN_SIZE bytes;
+# pre-encoded bodies and binary files (PDFs, images) pass through untouched
+app.config['COMPRESSION'] = os.environ.get('COMPRESSION', 'true').lower() == 'true'
+app.config['COMPRESSION_LEVEL'] = int(os.environ.get('COMPRESSION_LEVEL', 6))
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))
+app.config['COMPRESSION_BROTLI_QUALITY'] = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+if app.config['COMPRESSION']:
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app,
+                                         level=app.config['COMPRESSION_LEVEL'],
+                                         min_size=app.config['COMPRESSION_MIN_SIZE'],
+                                         brotli_quality=app.config['COMPRESSION_BROTLI_QUALITY'])
 
 
 # ============================================================================
@@ -900,13 +1632,6 @@ if __name__ == '__main__':
     os.makedirs('static/uploads', exist_ok=True)
     os.makedirs('logs', exist_ok=True)
 
-    # Create DB only once
-    if not os.path.exists("smilingtears.db"):
-        print("Database not found → Creating new SQLite database...")
-        init_db()
-    else:
-        print("Database exists → Skipping database initialization.")
-
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=True, host='0.0.0.0', port=port)
 
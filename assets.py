@@ -0,0 +1,146 @@
+"""
+Fingerprinted, precompressed static assets
+
+The build step copies every file under static/ (except uploads) to a name
+containing a hash of its content, writes .gz (and .br, when the brotli
+package is installed) next to text assets, and records the mapping in a
+manifest:
+
+    python assets.py build [--static static] [--out static_build]
+
+The web app loads the manifest once at startup, rewrites url_for('static')
+to the fingerprinted names and serves them with immutable caching.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+EXCLUDE_DIRS = ('uploads',)
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.ico', '.map')
+# Compressed copies smaller than this fraction of the original are not worth keeping
+MIN_SAVING = 0.9
+
+
+def fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def fingerprinted_name(filename, digest):
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def precompress(path):
+    """Write path.gz (and path.br) if they are usefully smaller; returns the encodings written"""
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    written = []
+    variants = [('gzip', '.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('br', '.br', lambda d: brotli.compress(d, quality=11)))
+
+    for encoding, suffix, compress in variants:
+        compressed = compress(data)
+        if len(compressed) < len(data) * MIN_SAVING:
+            _write_atomic(path + suffix, compressed)
+            written.append(encoding)
+    return written
+
+
+def build(static_dir, out_dir):
+    """Fingerprint and precompress static_dir into out_dir; returns the manifest"""
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.relpath(root, static_dir) == '.':
+            dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
+        for name in files:
+            source = os.path.join(root, name)
+            filename = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            built = fingerprinted_name(filename, fingerprint(source))
+
+            target = os.path.join(out_dir, built)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target + '.tmp')
+                os.replace(target + '.tmp', target)
+                if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+                    precompress(target)
+            manifest[filename] = built
+
+    os.makedirs(out_dir, exist_ok=True)
+    _write_atomic(os.path.join(out_dir, MANIFEST_NAME),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+class AssetManifest:
+    """The build manifest, loaded once; maps static filenames to fingerprinted ones"""
+
+    def __init__(self, out_dir):
+        self.out_dir = os.path.abspath(out_dir)
+        self.files = {}
+        self.version = None
+        try:
+            with open(os.path.join(self.out_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                self.files = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.version = hashlib.sha1(json.dumps(self.files, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+    def __bool__(self):
+        return bool(self.files)
+
+    def lookup(self, filename):
+        """Fingerprinted name for a static filename, or None if it was not built"""
+        return self.files.get(filename)
+
+    def variant(self, built, accept_encodings):
+        """(path, content-encoding or None) of the best stored variant for the client
+
+        Files from earlier builds are still served, for pages cached before a deploy.
+        """
+        path = os.path.abspath(os.path.join(self.out_dir, built))
+        if (not path.startswith(self.out_dir + os.sep) or built == MANIFEST_NAME
+                or not os.path.isfile(path)):
+            return None, None
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accept_encodings[encoding] > 0 and os.path.exists(path + suffix):
+                return path + suffix, encoding
+        return path, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress static assets")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--static', default='static')
+    parser.add_argument('--out', default=os.environ.get('ASSET_BUILD_DIR', 'static_build'))
+    args = parser.parse_args()
+
+    manifest = build(args.static, args.out)
+    print(f"Built {len(manifest)} assets into {args.out} "
+          f"({'gzip and brotli' if brotli is not None else 'gzip only; install brotli for .br'})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+"""
+Performance benchmarks for The Smiling Tear Foundation website
+
+Run from the project root, e.g. `python -m benchmarks.bench_receipts`.
+"""
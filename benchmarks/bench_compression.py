@@ -0,0 +1,130 @@
+"""
+Bandwidth and latency of response compression
+
+    python -m benchmarks.bench_compression [--requests N] [--bandwidth MBPS]
+
+Requests each route through the raw app and through CompressionMiddleware
+at a few levels, and reports body size, server time per request and the
+estimated time to first byte plus transfer on a link of the given
+bandwidth. Before measuring it checks that compressed bodies decode to the
+uncompressed ones, that streamed responses are flushed chunk by chunk and
+that PDFs and pre-encoded bodies pass through untouched.
+"""
+import argparse
+import gzip
+import os
+import tempfile
+import time
+import zlib
+
+from werkzeug.test import Client
+
+import database
+from compression import CompressionMiddleware, brotli
+
+ROUTES = ['/', '/about', '/programs', '/events', '/contact', '/volunteer', '/donate',
+          '/api/programs', '/api/events', '/api/events?limit=2&fields=title,date']
+
+
+def decode(response):
+    data = response.get_data()
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'br':
+        return brotli.decompress(data)
+    return data
+
+
+def self_check(raw):
+    """Fail loudly if the middleware changes what a client ends up with"""
+    plain = Client(raw)
+    for encoding in ('gzip', 'br') if brotli is not None else ('gzip',):
+        client = Client(CompressionMiddleware(raw, min_size=500))
+        for route in ROUTES:
+            expected = plain.get(route).get_data()
+            response = client.get(route, headers={'Accept-Encoding': encoding})
+            assert decode(response) == expected, route
+            if len(expected) >= 500:
+                assert response.headers.get('Content-Encoding') == encoding, route
+
+    # Small bodies are left alone
+    tiny = Client(CompressionMiddleware(raw, min_size=10 ** 9)).get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in tiny.headers
+
+    # Binary types pass through
+    def pdf_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/pdf'), ('Content-Length', '4096')])
+        return [b'%PDF' + b'\0' * 4092]
+    response = Client(CompressionMiddleware(pdf_app)).get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+
+    # Streamed bodies come out as several independently decodable flushes
+    def streaming_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/html')])
+        for i in range(5):
+            yield (f'<p>chunk {i}</p>' * 100).encode()
+    pieces = []
+    def collect(status, headers, exc_info=None):
+        pieces.append(dict(headers))
+    middleware = CompressionMiddleware(streaming_app)
+    environ = {'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': 'gzip'}
+    out = list(middleware(environ, collect))
+    assert pieces[0]['Content-Encoding'] == 'gzip' and len(out) > 2
+    d = zlib.decompressobj(31)
+    assert d.decompress(out[0]).startswith(b'<p>chunk 0</p>')
+    assert gzip.decompress(b''.join(out)) == b''.join(f'<p>chunk {i}</p>'.encode() * 100 for i in range(5))
+    print('self-check OK')
+
+
+def measure(client, route, encoding, requests):
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(route, headers=headers)
+        response.get_data()
+    return len(response.get_data()), (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--bandwidth', type=float, default=1.6, help='link speed in Mbit/s (default: slow 3G)')
+    parser.add_argument('--levels', default='1,6,9')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A scratch database, and no middleware from the app's own config
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        os.environ['COMPRESSION'] = 'false'
+        import app
+        raw = app.app.wsgi_app
+
+        self_check(raw)
+
+        variants = [('identity', Client(raw), None)]
+        for level in [int(level) for level in args.levels.split(',')]:
+            variants.append((f'gzip-{level}', Client(CompressionMiddleware(raw, level=level)), 'gzip'))
+        if brotli is not None:
+            variants.append(('br-4', Client(CompressionMiddleware(raw, brotli_quality=4)), 'br'))
+
+        bytes_per_second = args.bandwidth * 1e6 / 8
+        print(f"{'route':<40} {'variant':<10} {'bytes':>8} {'server ms':>10} {'total ms':>9}")
+        totals = {}
+        for route in ROUTES:
+            for name, client, encoding in variants:
+                size, seconds = measure(client, route, encoding, args.requests)
+                total = seconds + size / bytes_per_second
+                totals.setdefault(name, [0, 0.0])
+                totals[name][0] += size
+                totals[name][1] += total
+                print(f"{route:<40} {name:<10} {size:>8} {seconds * 1000:>10.2f} {total * 1000:>9.1f}")
+
+        print(f"\nAll routes at {args.bandwidth} Mbit/s:")
+        base = totals['identity'][0]
+        for name, (size, total) in totals.items():
+            print(f"  {name:<10} {size:>8} bytes ({size / base:.0%} of identity), {total * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Receipts per second for the donation receipt renderer
+
+    python -m benchmarks.bench_receipts [--count N] [--workers N]
+
+Compares drawing every line per receipt (the old inline code in donate()),
+the precompiled renderer, the renderer's process pool and cache hits.
+"""
+import argparse
+import time
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from receipts import ReceiptRenderer, render_receipt, receipt_lines
+
+
+def sample_receipt(n):
+    return {
+        'donation_id': f"BENCH{n:08d}",
+        'date': '2025-03-31 10:15:00',
+        'name': f"Donor {n}",
+        'email': f"donor{n}@example.org",
+        'phone': '9876543210',
+        'program': 'education',
+        'amount': 1000 + n % 5000,
+    }
+
+
+def render_inline(receipt):
+    """Every line drawn per receipt, as donate() used to do"""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(200, 750, "Donation Receipt")
+    c.setFont("Helvetica", 12)
+    for i, line in enumerate(receipt_lines(receipt)):
+        c.drawString(50, 720 - 20 * i, line)
+    c.line(50, 580, 550, 580)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, 560, "Organization Details:")
+    c.setFont("Helvetica", 11)
+    c.drawString(50, 540, "Smiling Tears Foundation")
+    c.drawString(50, 525, "Reg. No: 1234")
+    c.drawString(50, 510, "Address: Laxmi Nagar, Delhi")
+    c.drawString(50, 495, "Contact: 9009664469")
+    c.drawString(50, 480, "Email: smilingtearsfoundation@gmail.com")
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+def measure(label, render, receipts):
+    started = time.perf_counter()
+    for receipt in receipts:
+        render(receipt)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {len(receipts) / elapsed:10.1f} receipts/s")
+
+
+def measure_pool(workers, receipts):
+    renderer = ReceiptRenderer(workers=workers, cache_size=0)
+    executor = renderer._executor()
+    # Start the worker processes before timing
+    list(executor.map(render_receipt, receipts[:workers]))
+
+    started = time.perf_counter()
+    list(executor.map(render_receipt, receipts, chunksize=32))
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    print(f"{f'process pool ({workers} workers)':<28} {len(receipts) / elapsed:10.1f} receipts/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=2000, help='receipts per run')
+    parser.add_argument('--workers', type=int, default=4, help='process pool size (0 to skip)')
+    args = parser.parse_args()
+
+    receipts = [sample_receipt(n) for n in range(args.count)]
+
+    measure('inline (every line drawn)', render_inline, receipts)
+    measure('precompiled static part', render_receipt, receipts)
+
+    if args.workers > 0:
+        measure_pool(args.workers, receipts)
+
+    cached = ReceiptRenderer(cache_size=args.count)
+    for receipt in receipts:
+        cached.render(receipt)
+    measure('cache hit (re-download)', cached.render, receipts)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Hammer the ID allocator from many threads and processes
+
+    python -m benchmarks.stress_ids [--processes N] [--threads N] [--ids N]
+
+Every worker allocates donation and volunteer IDs against one scratch
+database (like gunicorn workers sharing smilingtears.db) and inserts the
+rows. The run fails if any ID is handed out twice.
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import database
+
+
+def allocate(db_path, count, results):
+    """Allocate `count` donation and volunteer IDs, appending them to results"""
+    # Point the app at the scratch database before importing it
+    database.DB_NAME = db_path
+    import app
+
+    conn = database.connect()
+    try:
+        for _ in range(count):
+            while True:
+                try:
+                    donation_id = app.generate_donation_id(conn)
+                    volunteer_id = app.generate_volunteer_id(conn)
+                    conn.execute("INSERT INTO donations (donation_id, status) VALUES (?, 'success')",
+                                 (donation_id,))
+                    conn.execute("INSERT INTO volunteer_applications (id, status) VALUES (?, 'pending')",
+                                 (volunteer_id,))
+                    conn.commit()
+                    break
+                except sqlite3.OperationalError:
+                    # Busy past busy_timeout: the rollback gives the IDs back
+                    conn.rollback()
+            results.append((donation_id, volunteer_id))
+    finally:
+        conn.close()
+
+
+def run_process(db_path, threads, count, queue):
+    results = []
+    workers = [threading.Thread(target=allocate, args=(db_path, count, results))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    queue.put(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ids', type=int, default=200, help='IDs per thread')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'stress.db')
+        database.DB_NAME = db_path
+        database.migrate()
+
+        ctx = multiprocessing.get_context('spawn')
+        queue = ctx.Queue()
+        started = time.perf_counter()
+        procs = [ctx.Process(target=run_process, args=(db_path, args.threads, args.ids, queue))
+                 for _ in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        results = [pair for _ in procs for pair in queue.get()]
+        for proc in procs:
+            proc.join()
+        elapsed = time.perf_counter() - started
+
+        expected = args.processes * args.threads * args.ids
+        donation_ids = {d for d, _ in results}
+        volunteer_ids = {v for _, v in results}
+        print(f"{len(results)} allocations in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s)")
+        print(f"unique donation IDs: {len(donation_ids)}, unique volunteer IDs: {len(volunteer_ids)}")
+
+        if not (len(results) == len(donation_ids) == len(volunteer_ids) == expected):
+            print("FAILED: duplicate or missing IDs")
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == '__main__':
+    main()
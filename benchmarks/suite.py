@@ -0,0 +1,346 @@
+"""
+Latency, throughput and memory benchmarks for every route
+
+    python -m benchmarks.suite [--scale N] [--content-scale N] [--requests N]
+                               [--gunicorn WORKERS | --url http://host:port]
+                               [--baseline benchmarks/baseline.json] [--save-baseline]
+
+Builds a scratch data/ directory and database with the synthetic data
+generators, then drives each route through the Flask test client (or over
+HTTP against a gunicorn it starts, or an already running server) and
+reports p50/p95/p99 latency, throughput and peak RSS. Results are compared
+with the stored baseline; a p95 more than --tolerance slower than the
+baseline fails the run, as does any response outside 2xx/3xx (and such a
+run is never saved as the baseline).
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(REPO_DIR, 'benchmarks', 'baseline.json')
+
+# A regression must also be at least this much slower in absolute terms
+MIN_REGRESSION_MS = 1.0
+
+
+def routes():
+    """(name, method, path, form data, needs admin session)
+
+    The HTML program/event/blog detail pages are left out: their templates
+    are not in the tree yet, so they only measure the 500 page.
+    """
+    donation = {'amount': '1000', 'program': 'program-1', 'name': 'Bench Donor',
+                'email': 'bench@example.org', 'phone': '9876543210'}
+    volunteer = {'name': 'Bench Volunteer', 'email': 'bench@example.org', 'phone': '9876543210',
+                 'city': 'Delhi', 'interests': 'education', 'message': 'benchmark'}
+    return [
+        ('home', 'GET', '/', None, False),
+        ('events', 'GET', '/events', None, False),
+        ('api_programs', 'GET', '/api/programs', None, False),
+        ('api_program_detail', 'GET', '/api/programs/7', None, False),
+        ('api_events', 'GET', '/api/events', None, False),
+        ('api_events_upcoming', 'GET', '/api/events?status=upcoming', None, False),
+        ('api_events_page', 'GET', '/api/events?limit=20&sort=-date&fields=title,date', None, False),
+        ('api_event_detail', 'GET', '/api/events/7', None, False),
+        ('api_blog', 'GET', '/api/blog', None, False),
+        ('api_blog_page', 'GET', '/api/blog?limit=20&category=health', None, False),
+        ('api_stats', 'GET', '/api/stats', None, False),
+        ('donate_post', 'POST', '/donate', donation, False),
+        ('volunteer_post', 'POST', '/volunteer', volunteer, False),
+        ('admin_dashboard', 'GET', '/admin/dashboard', None, True),
+        ('admin_donations', 'GET', '/admin/dashboard/donations', None, True),
+    ]
+
+
+def prepare(workdir, scale, content_scale, seed):
+    """Generate data/ and smilingtears.db in workdir (run in a child process)"""
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    from benchmarks import synthetic
+
+    slugs = synthetic.write_content('data', programs=max(10, content_scale // 10),
+                                    events=content_scale, posts=content_scale, seed=seed,
+                                    source_dir=os.path.join(REPO_DIR, 'data'))
+    synthetic.fill_database(donations=scale, volunteers=scale, seed=seed, program_slugs=slugs)
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def summarize(latencies, elapsed, statuses):
+    values = sorted(latencies)
+    return {
+        'p50_ms': percentile(values, 0.50) * 1000,
+        'p95_ms': percentile(values, 0.95) * 1000,
+        'p99_ms': percentile(values, 0.99) * 1000,
+        'rps': len(values) / elapsed if elapsed else 0.0,
+        'statuses': sorted(set(statuses)),
+    }
+
+
+class TestClientDriver:
+    """Requests through Flask's test client, in this process"""
+
+    def __init__(self, app_module):
+        self.app = app_module.app
+        self.client = self.app.test_client()
+        self.admin = self.app.test_client()
+        with self.admin.session_transaction() as session:
+            session['username'] = 'bench'
+            session['role'] = 'admin'
+
+    def request(self, method, path, data, admin):
+        client = self.admin if admin else self.client
+        response = client.open(path, method=method, data=data)
+        response.get_data()
+        return response.status_code
+
+    def run(self, method, path, data, admin, count, concurrency):
+        latencies, statuses = [], []
+        started = time.perf_counter()
+        for _ in range(count):
+            t = time.perf_counter()
+            statuses.append(self.request(method, path, data, admin))
+            latencies.append(time.perf_counter() - t)
+        return latencies, time.perf_counter() - started, statuses
+
+    def peak_rss_kb(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class HTTPDriver:
+    """Requests over HTTP with keep-alive connections, one per client thread"""
+
+    def __init__(self, base_url, admin_cookie, server_pid=None):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.admin_cookie = admin_cookie
+        self.server_pid = server_pid
+        self.local = threading.local()
+
+    def request(self, method, path, data, admin):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {'Cookie': self.admin_cookie} if admin else {}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (http.client.HTTPException, OSError):
+            self.local.conn = None
+            raise
+        if response.getheader('Connection', '').lower() == 'close':
+            conn.close()
+            self.local.conn = None
+        return response.status
+
+    def run(self, method, path, data, admin, count, concurrency):
+        def one(_):
+            t = time.perf_counter()
+            status = self.request(method, path, data, admin)
+            return time.perf_counter() - t, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(one, range(count)))
+        elapsed = time.perf_counter() - started
+        return [r[0] for r in results], elapsed, [r[1] for r in results]
+
+    def peak_rss_kb(self):
+        """Peak RSS summed over the server process and its workers (Linux only)"""
+        if self.server_pid is None:
+            return None
+        total = 0
+        for pid in [self.server_pid] + _children(self.server_pid):
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    total += next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+            except (OSError, StopIteration):
+                pass
+        return total
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(workdir, workers):
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'app:app'],
+        cwd=workdir, env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit('gunicorn exited during startup')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit('gunicorn did not start listening within 30s')
+
+
+def admin_cookie(app_module):
+    app = app_module.app
+    value = app.session_interface.get_signing_serializer(app).dumps({'username': 'bench', 'role': 'admin'})
+    return f"{app.config['SESSION_COOKIE_NAME']}={value}"
+
+
+def failed_routes(results):
+    """Names of routes that answered with anything but 2xx/3xx"""
+    return [name for name, result in results['routes'].items()
+            if any(not 200 <= status < 400 for status in result['statuses'])]
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against the baseline; returns the names of regressed routes"""
+    regressed = []
+    print(f"\n{'route':<22} {'p95 ms':>9} {'baseline':>9} {'change':>8}")
+    for name, result in results['routes'].items():
+        base = baseline.get('routes', {}).get(name)
+        if base is None:
+            continue
+        change = result['p95_ms'] / base['p95_ms'] - 1 if base['p95_ms'] else 0.0
+        flag = ''
+        if change > tolerance and result['p95_ms'] - base['p95_ms'] > MIN_REGRESSION_MS:
+            regressed.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<22} {result['p95_ms']:>9.2f} {base['p95_ms']:>9.2f} {change:>+8.0%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=10000, help='donation and volunteer rows')
+    parser.add_argument('--content-scale', type=int, default=1000, help='events and blog posts')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=200, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads (HTTP modes)')
+    server = parser.add_mutually_exclusive_group()
+    server.add_argument('--gunicorn', type=int, metavar='WORKERS', help='start gunicorn with N workers')
+    server.add_argument('--url', help='benchmark an already running server prepared from the same data')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    started = time.perf_counter()
+    ctx = multiprocessing.get_context('spawn')
+    proc = ctx.Process(target=prepare, args=(workdir, args.scale, args.content_scale, args.seed))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        raise SystemExit('data generation failed')
+    print(f"Generated {args.scale} donations/volunteers and {args.content_scale} events/posts "
+          f"in {time.perf_counter() - started:.1f}s ({workdir})")
+
+    # No outbound mail/SMS from the job queue, and receipts rendered inline
+    os.environ.setdefault('JOB_WORKERS', '0')
+    os.environ.setdefault('RECEIPT_WORKERS', '0')
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    import app as app_module
+
+    server_proc = None
+    if args.gunicorn:
+        server_proc, url = start_gunicorn(workdir, args.gunicorn)
+        driver = HTTPDriver(url, admin_cookie(app_module), server_proc.pid)
+        mode = f'gunicorn -w {args.gunicorn}'
+    elif args.url:
+        driver = HTTPDriver(args.url, admin_cookie(app_module))
+        mode = f'http {args.url}'
+    else:
+        driver = TestClientDriver(app_module)
+        mode = 'test client'
+
+    results = {
+        'mode': mode,
+        'scale': args.scale,
+        'content_scale': args.content_scale,
+        'requests': args.requests,
+        'python': platform.python_version(),
+        'routes': {},
+    }
+    try:
+        print(f"\n{'route':<22} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>9}  status")
+        for name, method, path, data, admin in routes():
+            driver.run(method, path, data, admin, args.warmup, args.concurrency)
+            latencies, elapsed, statuses = driver.run(method, path, data, admin,
+                                                      args.requests, args.concurrency)
+            result = results['routes'][name] = summarize(latencies, elapsed, statuses)
+            print(f"{name:<22} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                  f"{result['rps']:>9.1f}  {','.join(map(str, result['statuses']))}")
+        results['peak_rss_kb'] = driver.peak_rss_kb()
+    finally:
+        if server_proc is not None:
+            server_proc.terminate()
+            server_proc.wait()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if results['peak_rss_kb']:
+        print(f"\nPeak RSS: {results['peak_rss_kb'] / 1024:.0f} MB")
+
+    failed = failed_routes(results)
+    if failed:
+        print(f"\nFAILED: error responses from {', '.join(failed)}")
+        sys.exit(1)
+
+    regressed = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline.get('mode'), baseline.get('scale')) != (results['mode'], results['scale']):
+            print(f"\nNote: baseline was recorded with {baseline.get('mode')} at scale {baseline.get('scale')}")
+        regressed = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nSaved baseline to {args.baseline}")
+
+    if regressed:
+        print(f"\nFAILED: p95 regressed on {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+"""
+Seeded synthetic data for data/ and smilingtears.db
+
+    python -m benchmarks.synthetic --scale 1000000 [--seed 0] [--data-dir DIR] [--db PATH]
+    python -m benchmarks.synthetic --donations 1000000 --volunteers 50000 --events 5000 ...
+
+The same seed and sizes always produce the same data. Records are
+generated lazily: the JSON files are written one record at a time and
+table rows are bulk-inserted with executemany() in a single transaction,
+so memory use stays flat and a million donations take seconds.
+config.json and team-members.json are copied from the real data/ so every
+page renders. Synthetic users (admin@example.org, managerN@, volunteerN@)
+all have the password "password".
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import string
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import database
+
+CATEGORIES = ['education', 'health', 'environment', 'empowerment', 'relief']
+CITIES = ['Delhi', 'Lucknow', 'Mumbai', 'Pune', 'Jaipur', 'Patna', 'Bhopal', 'Kolkata']
+WORDS = ('community children school health camp village water trees women skills training '
+         'volunteers food clothes winter drive awareness books library clean village relief').split()
+
+# Fixed dates so the output does not depend on when it is generated
+START = datetime(2023, 4, 1)
+ANCHOR = date(2025, 10, 1)
+SPAN_SECONDS = 900 * 86400
+
+# Synthetic volunteer ids sit far above the YY<seq> ids the app allocates
+VOLUNTEER_ID_BASE = 9 * 10 ** 11
+PASSWORD = 'password'
+
+# Each record set gets its own random stream, so changing one size leaves
+# the others' records unchanged
+STREAMS = {'programs': 1, 'events': 2, 'posts': 3, 'donations': 4, 'volunteers': 5, 'users': 6}
+
+
+def stream(seed, name):
+    return random.Random(seed * 100 + STREAMS[name])
+
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def program_slugs(n):
+    return [f"program-{i + 1}" for i in range(n)]
+
+
+def make_programs(rng, n):
+    for i in range(n):
+        yield {
+            'id': i + 1,
+            'title': f"{words(rng, 2).title()} Program {i + 1}",
+            'slug': f"program-{i + 1}",
+            'category': rng.choice(CATEGORIES),
+            'description': words(rng, 25),
+            'featuredImage': 'education.jpg',
+            'iconColor': 'blue',
+            'backgroundColor': '#DBEAFE',
+            'features': [words(rng, 5) for _ in range(3)],
+            'impact': {'people_reached': rng.randint(10, 50000)},
+        }
+
+
+def make_events(rng, n, programs):
+    for i in range(n):
+        day = ANCHOR + timedelta(days=rng.randint(-720, 365))
+        yield {
+            'id': i + 1,
+            'slug': f"event-{i + 1}",
+            'title': f"{words(rng, 3).title()} {i + 1}",
+            'date': day.isoformat(),
+            'location': f"Community Hall, {rng.choice(CITIES)}",
+            'description': words(rng, 30),
+            'image': 'winter_drive.jpg',
+            'status': 'upcoming' if day >= ANCHOR else 'past',
+            'category': rng.choice(CATEGORIES),
+            'program': rng.choice(programs) if programs else None,
+        }
+
+
+def make_posts(rng, n, programs):
+    for i in range(n):
+        day = START + timedelta(days=rng.randint(0, 900))
+        yield {
+            'id': i + 1,
+            'slug': f"post-{i + 1}",
+            'title': words(rng, 5).title(),
+            'category': rng.choice(CATEGORIES),
+            'program': rng.choice(programs) if programs else None,
+            'date': day.date().isoformat(),
+            'displayDate': day.strftime('%B %d, %Y'),
+            'excerpt': words(rng, 20),
+            'content': words(rng, 300),
+            'featuredImage': {'featured': 'images/programs/education.jpg',
+                              'thumbnail': 'images/programs/education.jpg'},
+            'readTime': f"{rng.randint(2, 12)} min read",
+            'tags': [rng.choice(WORDS) for _ in range(3)],
+            'likes': rng.randint(0, 500),
+            'views': rng.randint(0, 20000),
+            'backgroundColor': '#DCFCE7',
+        }
+
+
+def random_timestamp(rng):
+    return (START + timedelta(seconds=int(rng.random() * SPAN_SECONDS))).isoformat()
+
+
+def donation_rows(rng, n, programs):
+    # The hot loop at large scales: lookup tables instead of per-row
+    # choice()/randint() and datetime arithmetic
+    r = rng.random
+    days = [(START + timedelta(days=d)).strftime('%Y-%m-%dT') for d in range(SPAN_SECONDS // 86400)]
+    times = [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in range(86400)]
+    donors = [(f"Donor {d}", f"donor{d}@example.org") for d in range(5000)]
+    amounts = (500, 1000, 2500, 5000, 10000)
+    for i in range(n):
+        name, email = donors[i % 5000]
+        yield (f"SYN{i:012d}", f"TXNSYN{i:012d}", amounts[int(r() * 5)],
+               programs[int(r() * len(programs))], name, email, f"98{i % 100000000:08d}",
+               int(r() < 0.1), days[int(r() * len(days))] + times[int(r() * 86400)],
+               'success' if r() < 0.97 else 'failed')
+
+
+def volunteer_rows(rng, n):
+    for i in range(n):
+        yield (VOLUNTEER_ID_BASE + i, f"Volunteer {i}", f"volunteer{i}@example.org",
+               f"97{i % 100000000:08d}", rng.choice(CITIES), ','.join(rng.sample(CATEGORIES, 2)),
+               words(rng, 12), random_timestamp(rng),
+               # Every tenth volunteer is approved and gets an account (see user_rows)
+               'approved' if i % 10 == 0 else ('pending' if rng.random() < 0.8 else 'rejected'))
+
+
+def password_hash(rng, password=PASSWORD, iterations=600000):
+    """A werkzeug-compatible pbkdf2 hash with a seeded salt, so the users table is reproducible too"""
+    salt = ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(16))
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), iterations).hex()
+    return f"pbkdf2:sha256:{iterations}${salt}${digest}"
+
+
+def user_rows(rng, n, password_hash):
+    yield ('admin', 'admin@example.org', password_hash, 'admin')
+    for i in range(1, n):
+        if i % 20 == 0:
+            yield (f"Manager {i}", f"manager{i}@example.org", password_hash, 'manager')
+        else:
+            # Accounts of approved volunteers (volunteer ids 0, 10, 20, ...)
+            yield (f"Volunteer {i * 10}", f"volunteer{i * 10}@example.org", password_hash, 'volunteer')
+
+
+def write_json_stream(path, key, records):
+    """Write {"<key>": [records...]} one record at a time; returns the record count"""
+    count = 0
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(f'{{"{key}": [')
+        for record in records:
+            if count:
+                f.write(',\n')
+            f.write(json.dumps(record))
+            count += 1
+        f.write(']}\n')
+    os.replace(tmp, path)
+    return count
+
+
+def write_content(data_dir, programs=100, events=1000, posts=1000, seed=0, source_dir='data'):
+    """Write programs/events/blog-posts JSON files of the given sizes into data_dir
+
+    Returns the program slugs, for linking donations to programs.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    for name in ('config.json', 'team-members.json'):
+        shutil.copyfile(os.path.join(source_dir, name), os.path.join(data_dir, name))
+
+    slugs = program_slugs(programs)
+    write_json_stream(os.path.join(data_dir, 'programs.json'), 'programs',
+                      make_programs(stream(seed, 'programs'), programs))
+    write_json_stream(os.path.join(data_dir, 'events.json'), 'events',
+                      make_events(stream(seed, 'events'), events, slugs))
+    write_json_stream(os.path.join(data_dir, 'blog-posts.json'), 'posts',
+                      make_posts(stream(seed, 'posts'), posts, slugs))
+    return slugs
+
+
+def fill_database(donations=10000, volunteers=10000, users=100, seed=0, program_slugs=None, report=None):
+    """Bulk-insert donations, volunteer applications and users into database.DB_NAME"""
+    program_slugs = program_slugs or CATEGORIES
+    users_rng = stream(seed, 'users')
+    tables = [
+        ('donations', donations, """
+            INSERT INTO donations
+            (donation_id, transaction_id, amount, program, donor_name, donor_email, donor_phone,
+             is_anonymous, timestamp, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, donation_rows(stream(seed, 'donations'), donations, program_slugs)),
+        ('volunteer_applications', volunteers, """
+            INSERT INTO volunteer_applications
+            (id, name, email, phone, city, interests, message, timestamp, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, volunteer_rows(stream(seed, 'volunteers'), volunteers)),
+        ('users', users, """
+            INSERT OR IGNORE INTO users (username, email, password, role) VALUES (?, ?, ?, ?)
+        """, user_rows(users_rng, users, password_hash(users_rng))),
+    ]
+
+    database.migrate()
+    conn = database.connect()
+    try:
+        # One transaction; indexes are dropped for the load and rebuilt once
+        # at the end, which is several times faster than updating them per row
+        conn.execute("BEGIN")
+        for table, count, sql, rows in tables:
+            if not count:
+                continue
+            started = time.perf_counter()
+            indexes = conn.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                (table,)).fetchall()
+            for index in indexes:
+                conn.execute(f"DROP INDEX {index['name']}")
+            conn.executemany(sql, rows)
+            for index in indexes:
+                conn.execute(index['sql'])
+            if report:
+                report(table, count, time.perf_counter() - started)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic data for data/ and the database")
+    parser.add_argument('--scale', type=int, default=10000,
+                        help='donations; the other sizes default to fractions of it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--programs', type=int)
+    parser.add_argument('--events', type=int)
+    parser.add_argument('--posts', type=int)
+    parser.add_argument('--donations', type=int)
+    parser.add_argument('--volunteers', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--data-dir', default=os.path.join('synthetic', 'data'))
+    parser.add_argument('--db', default=os.path.join('synthetic', database.DB_NAME))
+    parser.add_argument('--force', action='store_true', help='overwrite existing files')
+    args = parser.parse_args()
+
+    sizes = {
+        'programs': args.programs if args.programs is not None else max(10, args.scale // 10000),
+        'events': args.events if args.events is not None else max(10, args.scale // 100),
+        'posts': args.posts if args.posts is not None else max(10, args.scale // 100),
+        'donations': args.donations if args.donations is not None else args.scale,
+        'volunteers': args.volunteers if args.volunteers is not None else max(10, args.scale // 10),
+        'users': args.users if args.users is not None else max(1, args.scale // 100),
+    }
+
+    existing = [path for path in (args.db, os.path.join(args.data_dir, 'programs.json')) if os.path.exists(path)]
+    if existing and not args.force:
+        sys.exit(f"{', '.join(existing)} already exists; pass --force to overwrite")
+    if os.path.exists(args.db):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+    source_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+    started = time.perf_counter()
+    slugs = write_content(args.data_dir, sizes['programs'], sizes['events'], sizes['posts'],
+                          seed=args.seed, source_dir=source_dir)
+    print(f"{sizes['programs']} programs, {sizes['events']} events, {sizes['posts']} posts "
+          f"-> {args.data_dir} in {time.perf_counter() - started:.1f}s")
+
+    os.makedirs(os.path.dirname(args.db) or '.', exist_ok=True)
+    database.DB_NAME = args.db
+    fill_database(sizes['donations'], sizes['volunteers'], sizes['users'], seed=args.seed, program_slugs=slugs,
+                  report=lambda table, count, seconds: print(
+                      f"{count} {table} in {seconds:.1f}s ({count / seconds:,.0f} rows/s)"))
+    print(f"Done in {time.perf_counter() - started:.1f}s -> {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""
+Response compression middleware
+
+Wraps the WSGI app and gzip- or brotli-encodes text responses (HTML, JSON,
+CSS, JS, SVG) for clients that accept it. Responses that already carry a
+Content-Encoding, such as the pre-gzipped /api bodies and precompressed
+assets, are passed through, as are binary types like PDFs and images.
+Streamed responses are compressed chunk by chunk and flushed as they go.
+"""
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush):
+        out = self._z.compress(data)
+        return out + self._z.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        return self._z.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data, flush):
+        out = self._c.process(data)
+        return out + self._c.flush() if flush else out
+
+    def finish(self):
+        return self._c.finish()
+
+
+class CompressionMiddleware:
+    """gzip/brotli for compressible responses of at least min_size bytes"""
+
+    def __init__(self, app, level=6, min_size=500, brotli_quality=4):
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self, accept_encoding):
+        """The encoding to use for an Accept-Encoding header, or None"""
+        if not accept_encoding:
+            return None
+        accept = parse_accept_header(accept_encoding)
+        best = max(self.encodings, key=lambda e: accept[e])
+        return best if accept[best] > 0 else None
+
+    def _compressor(self, encoding):
+        return _Brotli(self.brotli_quality) if encoding == 'br' else _Gzip(self.level)
+
+    def _wants_compression(self, status, headers):
+        if status[:3] in ('204', '206', '304') or int(status[:3]) < 200:
+            return False
+        content_type = content_length = None
+        for name, value in headers:
+            lname = name.lower()
+            if lname == 'content-encoding':
+                return False
+            if lname == 'cache-control' and 'no-transform' in value:
+                return False
+            if lname == 'content-type':
+                content_type = value.split(';')[0].strip().lower()
+            elif lname == 'content-length':
+                content_length = int(value)
+        if content_type is None or not content_type.startswith(COMPRESSIBLE_TYPES):
+            return False
+        return content_length is None or content_length >= self.min_size
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        state = {}
+        written = []
+
+        def capture(status, headers, exc_info=None):
+            if self._wants_compression(status, headers):
+                state['deferred'] = (status, headers, exc_info)
+                return written.append
+            state.pop('deferred', None)
+            state['passthrough'] = True
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, capture)
+        if state.get('passthrough'):
+            return app_iter
+        return self._compress(app_iter, state, written, encoding, start_response)
+
+    def _compress(self, app_iter, state, written, encoding, start_response):
+        try:
+            chunks = iter(app_iter)
+
+            # Hold back the start of the body until it is clearly worth compressing.
+            # Apps that call start_response lazily have done so after their first chunk.
+            head, size = list(written), sum(map(len, written))
+            for chunk in chunks:
+                head.append(chunk)
+                size += len(chunk)
+                if size >= self.min_size or state.get('passthrough'):
+                    break
+
+            if 'deferred' not in state:
+                yield from head
+                yield from chunks
+                return
+
+            status, headers, exc_info = state['deferred']
+            if size < self.min_size:
+                start_response(status, _without(headers, 'content-length') + [('Content-Length', str(size))],
+                               exc_info)
+                yield b''.join(head)
+                return
+
+            streamed = not any(name.lower() == 'content-length' for name, _ in headers)
+            start_response(status, _compressed_headers(headers, encoding), exc_info)
+            compressor = self._compressor(encoding)
+            out = compressor.compress(b''.join(head), flush=streamed)
+            if out:
+                yield out
+            for chunk in chunks:
+                out = compressor.compress(chunk, flush=streamed)
+                if out:
+                    yield out
+            yield compressor.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def _without(headers, *names):
+    return [(k, v) for k, v in headers if k.lower() not in names]
+
+
+def _compressed_headers(headers, encoding):
+    headers = _without(headers, 'content-length', 'content-md5')
+    vary = None
+    for i, (name, value) in enumerate(headers):
+        lname = name.lower()
+        if lname == 'etag' and not value.startswith('W/'):
+            # The compressed body is a different representation
+            headers[i] = (name, 'W/' + value)
+        elif lname == 'vary':
+            vary = i
+    if vary is None:
+        headers.append(('Vary', 'Accept-Encoding'))
+    elif 'accept-encoding' not in headers[vary][1].lower():
+        headers[vary] = ('Vary', headers[vary][1] + ', Accept-Encoding')
+    headers.append(('Content-Encoding', encoding))
+    return headers
@@ -0,0 +1,2 @@
+# The modules live at the top level of the repo, not in a package; this file being
+# here puts the repo root on sys.path so plain `pytest` can import them.
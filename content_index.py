@@ -0,0 +1,104 @@
+"""
+Lookup indexes for programs, events and blog posts
+
+The builders take the parsed JSON files and return plain dicts so that
+detail pages and API lookups are a single dict access. They are meant to
+be cached with ContentStore.derived(), which rebuilds them only when the
+underlying data file changes.
+"""
+
+RELATED_POSTS_LIMIT = 3
+
+# Fields each listing can be sorted by through the API
+PROGRAM_SORT_FIELDS = ('title',)
+EVENT_SORT_FIELDS = ('date', 'title')
+BLOG_SORT_FIELDS = ('date', 'title', 'views', 'likes')
+
+
+def _index_by(records, key):
+    """Map record[key] -> record, keeping the first record for duplicate keys"""
+    index = {}
+    for record in records:
+        value = record.get(key)
+        if value is not None:
+            index.setdefault(str(value), record)
+    return index
+
+
+def _bucket_by(records, key):
+    """Group records by record[key], preserving file order within each group"""
+    buckets = {}
+    for record in records:
+        buckets.setdefault(record.get(key), []).append(record)
+    return buckets
+
+
+def sort_key(value):
+    """Order missing values first, then numbers, then strings"""
+    if value is None:
+        return (0, '')
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    return (2, str(value))
+
+
+def _sort_orders(records, fields):
+    """For each field, the sorted list of (sort_key, position) over records
+
+    The position makes every entry unique, so an entry doubles as a
+    pagination cursor. The None entry keeps file order.
+    """
+    orders = {None: [(sort_key(None), position) for position in range(len(records))]}
+    for field in fields:
+        orders[field] = sorted((sort_key(record.get(field)), position)
+                               for position, record in enumerate(records))
+    return orders
+
+
+def build_program_index(programs_data):
+    """Build slug and id lookups for programs.json"""
+    programs = programs_data.get('programs', [])
+    return {
+        'all': programs,
+        'by_slug': _index_by(programs, 'slug'),
+        'by_id': _index_by(programs, 'id'),
+        'by_category': _bucket_by(programs, 'category'),
+        'sorted': _sort_orders(programs, PROGRAM_SORT_FIELDS),
+    }
+
+
+def build_event_index(events_data):
+    """Build slug/id lookups and status buckets for events.json"""
+    events = events_data.get('events', [])
+    return {
+        'all': events,
+        'by_slug': _index_by(events, 'slug'),
+        'by_id': _index_by(events, 'id'),
+        'by_status': _bucket_by(events, 'status'),
+        'by_category': _bucket_by(events, 'category'),
+        'by_program': _bucket_by(events, 'program'),
+        'sorted': _sort_orders(events, EVENT_SORT_FIELDS),
+    }
+
+
+def build_blog_index(blog_data):
+    """Build slug/id lookups, category buckets and related posts for blog-posts.json"""
+    posts = blog_data.get('posts', [])
+    by_slug = _index_by(posts, 'slug')
+    by_category = _bucket_by(posts, 'category')
+
+    # Related posts: same category, excluding the post itself, in file order
+    related = {}
+    for slug, post in by_slug.items():
+        candidates = by_category.get(post.get('category'), [])[:RELATED_POSTS_LIMIT + 1]
+        related[slug] = [p for p in candidates if p is not post][:RELATED_POSTS_LIMIT]
+
+    return {
+        'all': posts,
+        'by_slug': by_slug,
+        'by_id': _index_by(posts, 'id'),
+        'by_category': by_category,
+        'related': related,
+        'by_program': _bucket_by(posts, 'program'),
+        'sorted': _sort_orders(posts, BLOG_SORT_FIELDS),
+    }
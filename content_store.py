@@ -0,0 +1,124 @@
+"""
+In-process content store for the JSON files under data/
+
+Each file is parsed once and kept in memory. The file's mtime is
+re-checked at most once every `check_interval` seconds and the file is
+re-parsed only when it has changed on disk. Values derived from one or
+more files (indexes, view models) are cached alongside and rebuilt only
+when one of their source files changes.
+
+Lookups, including the stat and any re-parse, count towards the request's
+'json' phase (profiling); derived builders do not, since they may render
+templates, which are timed on their own.
+"""
+import json
+import os
+import threading
+import time
+
+from profiling import phase
+
+DATA_DIR = 'data'
+
+
+class ContentStore:
+    """Cache of parsed data files, revalidated by stat/mtime"""
+
+    def __init__(self, data_dir=DATA_DIR, check_interval=2.0):
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self._entries = {}
+        self._derived = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'reloads': 0}
+
+    def _path(self, filename):
+        return os.path.join(self.data_dir, filename)
+
+    def _stat(self, filename):
+        try:
+            st = os.stat(self._path(filename))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _parse(self, filename):
+        try:
+            with open(self._path(filename), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            return {}
+
+    def _entry(self, filename):
+        """Return the up-to-date cache entry for a file, reloading if needed"""
+        with phase('json'):
+            return self._lookup(filename)
+
+    def _lookup(self, filename):
+        now = time.monotonic()
+        entry = self._entries.get(filename)
+
+        if entry is not None and now - entry['checked_at'] < self.check_interval:
+            self._counters['hits'] += 1
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(filename)
+            stamp = self._stat(filename)
+
+            if entry is not None and entry['stamp'] == stamp:
+                entry['checked_at'] = now
+                self._counters['hits'] += 1
+                return entry
+
+            if entry is None:
+                self._counters['misses'] += 1
+            else:
+                self._counters['reloads'] += 1
+
+            entry = {
+                'data': self._parse(filename),
+                'stamp': stamp,
+                'checked_at': now,
+            }
+            self._entries[filename] = entry
+            return entry
+
+    def get(self, filename):
+        """Return the parsed contents of data/<filename>"""
+        return self._entry(filename)['data']
+
+    def version(self, filename):
+        """Return an opaque token that changes whenever the file changes"""
+        return self._entry(filename)['stamp']
+
+    def derived(self, name, filenames, builder):
+        """Return builder(*parsed_files), rebuilt only when one of the files changes"""
+        entries = [self._entry(f) for f in filenames]
+        versions = tuple(e['stamp'] for e in entries)
+
+        cached = self._derived.get(name)
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        value = builder(*(e['data'] for e in entries))
+        self._derived[name] = (versions, value)
+        return value
+
+    def invalidate(self, filename=None):
+        """Drop one cached file, or every file when no name is given"""
+        with self._lock:
+            if filename is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(filename, None)
+            self._derived.clear()
+
+    def stats(self):
+        """Return hit/miss/reload counters and the number of cached files"""
+        counters = dict(self._counters)
+        counters['files'] = len(self._entries)
+        counters['derived'] = len(self._derived)
+        return counters
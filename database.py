@@ -1,72 +1,538 @@
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+
+from flask import g, has_app_context
 
 DB_NAME = "smilingtears.db"
 
-def get_db():
-    conn = sqlite3.connect(DB_NAME)
+# Connections kept open per worker process
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+# Seconds a request waits for a free connection before giving up
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+# Compiled statements sqlite3 keeps per connection
+CACHED_STATEMENTS = int(os.environ.get("DB_CACHED_STATEMENTS", 256))
+
+# Storage profile applied to every new connection. WAL lets several
+# gunicorn workers write while the admin dashboard reads.
+PRAGMAS = {
+    "journal_mode": os.environ.get("DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("DB_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000)),
+    "mmap_size": int(os.environ.get("DB_MMAP_SIZE", 64 * 1024 * 1024)),
+    "cache_size": int(os.environ.get("DB_CACHE_SIZE", -16000)),  # negative = KiB
+    "temp_store": os.environ.get("DB_TEMP_STORE", "MEMORY"),
+}
+
+# PRAGMA synchronous / temp_store report numbers; map them back to names
+_SYNCHRONOUS_NAMES = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+_TEMP_STORE_NAMES = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+
+def apply_pragmas(conn):
+    for name, value in PRAGMAS.items():
+        conn.execute(f"PRAGMA {name}={value}")
+
+
+def connect():
+    """Open a new SQLite connection with Row results and the storage profile applied"""
+    conn = sqlite3.connect(DB_NAME, check_same_thread=False,
+                           cached_statements=CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    apply_pragmas(conn)
     return conn
 
 
+def storage_profile(conn=None):
+    """Return the storage settings actually in effect and any that differ from PRAGMAS"""
+    own = conn is None
+    if own:
+        conn = connect()
+    try:
+        active = {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in PRAGMAS}
+    finally:
+        if own:
+            conn.close()
+
+    active["journal_mode"] = str(active["journal_mode"]).upper()
+    active["synchronous"] = _SYNCHRONOUS_NAMES.get(active["synchronous"], active["synchronous"])
+    active["temp_store"] = _TEMP_STORE_NAMES.get(active["temp_store"], active["temp_store"])
+
+    mismatched = {name: (str(PRAGMAS[name]).upper(), str(value).upper())
+                  for name, value in active.items()
+                  if str(value).upper() != str(PRAGMAS[name]).upper()}
+    return active, mismatched
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared by the threads of one process"""
+
+    def __init__(self, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._size = 0
+        self._stats = {
+            "acquired": 0,
+            "waits": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    def acquire(self):
+        waited = 0.0
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+
+        if conn is None:
+            with self._lock:
+                if self._size < self.max_size:
+                    self._size += 1
+                    create = True
+                else:
+                    create = False
+
+            if create:
+                try:
+                    conn = connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(
+                        "timed out waiting for a database connection")
+                waited = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    self._stats["waits"] += 1
+                    self._stats["wait_ms_total"] += waited
+                    self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited)
+
+        with self._lock:
+            self._stats["acquired"] += 1
+        for hook in acquire_hooks:
+            hook(waited / 1000)
+        return conn
+
+    def release(self, conn):
+        # Never hand the next request a half-finished transaction
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self.discard(conn)
+            return
+        self._idle.put(conn)
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._size -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["max_size"] = self.max_size
+        stats["idle"] = self._idle.qsize()
+        stats["in_use"] = stats["size"] - stats["idle"]
+        return stats
+
+
+# Called as hook(seconds) after every connection handed out by a pool, with the
+# time spent waiting for one (0 when a connection was free)
+acquire_hooks = []
+
+# Called as hook(sql, params, seconds) after every statement run on a
+# request's connection (profiling, metrics, the slow query log). Seconds
+# cover execute() and reading the statement's rows; see TracedCursor.
+query_hooks = []
+
+
+class TracedCursor:
+    """Cursor whose statements are reported to query_hooks
+
+    A statement is timed from execute() until its rows have been read:
+    fetchall(), iteration reaching the end, or a fetchone()/fetchmany()
+    that comes back empty or short. Statements without rows are reported
+    straight away; one whose rows are only partly read is reported when
+    the cursor runs its next statement, is closed or is garbage collected.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        # [sql, params, seconds so far] of a statement whose rows are still being read
+        self._pending = None
+
+    def _report(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            for hook in query_hooks:
+                hook(*pending)
+
+    def _run(self, method, sql, params, report_params):
+        self._report()
+        started = time.perf_counter()
+        try:
+            method(sql, params)
+        finally:
+            self._pending = [sql, report_params, time.perf_counter() - started]
+            if self._cursor.description is None:
+                self._report()
+        return self
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - started
+
+    def execute(self, sql, params=()):
+        return self._run(self._cursor.execute, sql, params, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._run(self._cursor.executemany, sql, seq_of_params, None)
+
+    def fetchone(self):
+        row = self._fetch(self._cursor.fetchone)
+        if row is None:
+            self._report()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self._cursor.arraysize if size is None else size
+        rows = self._fetch(self._cursor.fetchmany, size)
+        if len(rows) < size:
+            self._report()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self._cursor.fetchall)
+        self._report()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._report()
+        self._cursor.close()
+
+    def __del__(self):
+        if self._pending is not None:
+            self._report()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """Request-scoped handle on a pooled connection
+
+    close() is a no-op so existing `conn.close()` calls in the routes are
+    harmless; the connection goes back to the pool on app-context teardown.
+    Statements go through TracedCursor while any query_hooks are registered.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def close(self):
+        pass
+
+    def cursor(self):
+        if not query_hooks:
+            return self._conn.cursor()
+        return TracedCursor(self._conn.cursor())
+
+    def execute(self, sql, params=()):
+        if not query_hooks:
+            return self._conn.execute(sql, params)
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        if not query_hooks:
+            return self._conn.executemany(sql, seq_of_params)
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return this process's pool, creating a fresh one after a fork"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool()
+        return _pool
+
+
+def get_db():
+    """Return the request's connection, or a standalone one outside Flask"""
+    if not has_app_context():
+        return connect()
+
+    if "db" not in g:
+        g.db = PooledConnection(get_pool().acquire())
+    return g.db
+
+
+def close_db(exception=None):
+    """Return the request's connection to the pool"""
+    db = g.pop("db", None)
+    if db is not None:
+        get_pool().release(db._conn)
+
+
+def fetch_page(conn, table, where=(), params=(), cursor=None, limit=50):
+    """Keyset-paginate `table` newest first
+
+    Returns (rows, next_cursor); pass next_cursor back in to get the
+    following page. next_cursor is None on the last page.
+    """
+    clauses = list(where)
+    params = list(params)
+    if cursor is not None:
+        clauses.append("id < ?")
+        params.append(cursor)
+
+    sql = f"SELECT * FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    rows = conn.execute(sql, params).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1]["id"]
+    return rows, None
+
+
+def next_sequence_value(conn, name, seed=None):
+    """Increment sequence `name` and return its new value
+
+    The increment is a write, so it holds SQLite's write lock until the
+    caller commits: concurrent workers can never get the same value, and
+    a rolled-back insert gives its value back. `seed` is called once to
+    pick the starting value when the sequence does not exist yet.
+    """
+    start = 0
+    if seed is not None and conn.execute(
+            "SELECT 1 FROM sequences WHERE name = ?", (name,)).fetchone() is None:
+        start = seed(conn)
+
+    conn.execute("""
+        INSERT INTO sequences (name, value) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET value = value + 1
+    """, (name, start + 1))
+    return conn.execute("SELECT value FROM sequences WHERE name = ?", (name,)).fetchone()[0]
+
+
+def pool_stats():
+    """Pool size, connections in use and time spent waiting for a connection"""
+    return get_pool().stats()
+
+
+# ============================================================================
+# SCHEMA MIGRATIONS
+# ============================================================================
+# Each entry is (version, description, steps); a step is an SQL string or a
+# function taking the connection. The schema version is kept in PRAGMA
+# user_version; pending migrations run in order, each in its own
+# transaction. Append new entries, never edit applied ones.
+
+# Contact form submissions saved by older versions of the site
+LEGACY_CONTACT_SUBMISSIONS = "data/contact_submissions.json"
+
+
+def import_contact_submissions(conn, path=LEGACY_CONTACT_SUBMISSIONS):
+    """Copy submissions from the legacy JSON file into contact_submissions"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            submissions = json.load(f).get("submissions", [])
+    except (OSError, ValueError):
+        return 0
+
+    conn.executemany("""
+        INSERT INTO contact_submissions (name, email, phone, message, timestamp, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(s.get("name"), s.get("email"), s.get("phone"), s.get("message"),
+           s.get("timestamp"), s.get("status", "new")) for s in submissions])
+    return len(submissions)
+
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT,
+            email TEXT UNIQUE,
+            password TEXT,
+            role TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS volunteer_applications (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            email TEXT,
+            phone TEXT,
+            city TEXT,
+            interests TEXT,
+            message TEXT,
+            timestamp TEXT,
+            status TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS donations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            donation_id TEXT,
+            transaction_id TEXT,
+            amount REAL,
+            program TEXT,
+            donor_name TEXT,
+            donor_email TEXT,
+            donor_phone TEXT,
+            is_anonymous INTEGER,
+            timestamp TEXT,
+            status TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS contact_submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            email TEXT,
+            phone TEXT,
+            message TEXT,
+            timestamp TEXT,
+            status TEXT
+        )
+        """,
+    ]),
+    (2, "indexes on hot lookup columns", [
+        # signup: approved-volunteer check
+        "CREATE INDEX IF NOT EXISTS idx_volunteer_applications_email_status"
+        " ON volunteer_applications (email, status)",
+        # login (users.email is already covered by its UNIQUE constraint)
+        "CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)",
+        # donation dashboards and reports
+        "CREATE INDEX IF NOT EXISTS idx_donations_timestamp ON donations (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_donations_program ON donations (program)",
+        "CREATE INDEX IF NOT EXISTS idx_donations_donor_email ON donations (donor_email)",
+    ]),
+    (3, "background job queue", [
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_at REAL NOT NULL,
+            locked_by TEXT,
+            locked_at REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)",
+        """
+        CREATE TABLE IF NOT EXISTS dead_jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            failed_at TEXT NOT NULL
+        )
+        """,
+    ]),
+    (4, "contact submissions move from JSON into SQLite", [
+        import_contact_submissions,
+        "CREATE INDEX IF NOT EXISTS idx_contact_submissions_status ON contact_submissions (status)",
+    ]),
+    (5, "id sequences", [
+        """
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ]),
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    """Bring the database up to the latest schema version; returns the versions applied"""
+    conn = connect()
+    applied = []
+    try:
+        for version, description, steps in MIGRATIONS:
+            # Take the write lock before re-checking so concurrent workers
+            # starting up together apply each migration exactly once
+            conn.execute("BEGIN IMMEDIATE")
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            try:
+                for step in steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append((version, description))
+    finally:
+        conn.close()
+    return applied
+
+
 def init_db():
-    conn = get_db()
-    cur = conn.cursor()
-
-    # Users table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT,
-        email TEXT UNIQUE,
-        password TEXT,
-        role TEXT
-    )
-    """)
-
-    # Volunteer Applications table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS volunteer_applications (
-        id INTEGER PRIMARY KEY,
-        name TEXT,
-        email TEXT,
-        phone TEXT,
-        city TEXT,
-        interests TEXT,
-        message TEXT,
-        timestamp TEXT,
-        status TEXT
-    )
-    """)
-
-    # Donations table
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS donations (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        donation_id TEXT,
-        transaction_id TEXT,
-        amount REAL,
-        program TEXT,
-        donor_name TEXT,
-        donor_email TEXT,
-        donor_phone TEXT,
-        is_anonymous INTEGER,
-        timestamp TEXT,
-        status TEXT
-    )
-    """)
-
-    # Contact Submissions
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS contact_submissions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        email TEXT,
-        phone TEXT,
-        message TEXT,
-        timestamp TEXT,
-        status TEXT
-    )
-    """)
-
-    conn.commit()
-    conn.close()
+    """Create or upgrade the database schema"""
+    return migrate()
@@ -0,0 +1,151 @@
+"""
+Group commit for donation and volunteer inserts
+
+Instead of every request committing (and fsyncing) its own row, request
+threads hand their insert to one writer thread per process. The writer
+runs everything that arrives within `max_delay` seconds, up to
+`max_batch` writes, in a single transaction and wakes each caller once
+that transaction has committed.
+
+A caller that gives up waiting (submit's timeout) withdraws its write if
+the writer has not started it; otherwise it waits for that batch, so a
+timeout always means the row was not written.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database import connect
+
+# Called as hook(batch_size, seconds) after every committed batch (metrics)
+commit_hooks = []
+
+
+class GroupCommitWriter:
+    """Single writer thread that commits concurrent inserts in small batches"""
+
+    def __init__(self, max_batch=64, max_delay=0.005, timeout=30):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stats = {
+            'batches': 0,
+            'writes': 0,
+            'failed': 0,
+            'batch_size_max': 0,
+            'commit_ms_total': 0.0,
+            'commit_ms_max': 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's thread and queue are gone
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='group-commit-writer', daemon=True).start()
+
+    def submit(self, work):
+        """Run work(conn) in the next batch and return its result once committed
+
+        Raises TimeoutError, with nothing written, if the writer has not
+        started work within the timeout.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((work, future))
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise TimeoutError("write not started within the group commit timeout; nothing was written")
+        # Already running in an open transaction: its outcome is moments away
+        return future.result()
+
+    def _collect(self):
+        """Block for the first write, then gather more for up to max_delay"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = connect()
+        while True:
+            batch = self._collect()
+            try:
+                self._commit(conn, batch)
+            except Exception as e:
+                # The transaction failed as a whole: nothing in it is durable
+                try:
+                    conn.rollback()
+                except Exception:
+                    conn = connect()
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                with self._lock:
+                    self._stats['failed'] += len(batch)
+
+    def _commit(self, conn, batch):
+        started = time.perf_counter()
+        results = []
+
+        conn.execute("BEGIN IMMEDIATE")
+        for work, future in batch:
+            if not future.set_running_or_notify_cancel():
+                # The caller timed out and withdrew it
+                continue
+            # A savepoint per write so one bad row does not sink the batch
+            conn.execute("SAVEPOINT write")
+            try:
+                result = work(conn)
+            except Exception as e:
+                conn.execute("ROLLBACK TO write")
+                conn.execute("RELEASE write")
+                future.set_exception(e)
+                with self._lock:
+                    self._stats['failed'] += 1
+                continue
+            conn.execute("RELEASE write")
+            results.append((future, result))
+        conn.commit()
+
+        seconds = time.perf_counter() - started
+        elapsed = seconds * 1000
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['writes'] += len(results)
+            self._stats['batch_size_max'] = max(self._stats['batch_size_max'], len(batch))
+            self._stats['commit_ms_total'] += elapsed
+            self._stats['commit_ms_max'] = max(self._stats['commit_ms_max'], elapsed)
+        for hook in commit_hooks:
+            hook(len(batch), seconds)
+
+        for future, result in results:
+            future.set_result(result)
+
+    def stats(self):
+        """Batch size and commit latency counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        batches = stats['batches']
+        stats['batch_size_avg'] = stats['writes'] / batches if batches else 0.0
+        stats['commit_ms_avg'] = stats['commit_ms_total'] / batches if batches else 0.0
+        stats['pending'] = self._queue.qsize()
+        return stats
@@ -0,0 +1,87 @@
+"""
+Conditional GET support for the public pages and JSON APIs
+
+Views declare what their response is built from (data files, templates)
+and a Cache-Control policy. The ETag and Last-Modified validators are
+computed from those versions alone, so a matching If-None-Match or
+If-Modified-Since is answered with 304 before the view runs.
+"""
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+
+def tree_mtime(path):
+    """Latest mtime (seconds) of any file under path"""
+    latest = 0.0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                latest = max(latest, os.stat(os.path.join(root, name)).st_mtime)
+            except OSError:
+                pass
+    return latest
+
+
+def validators(versions, modified):
+    """(weak etag, last-modified datetime) for a tuple of version tokens"""
+    etag = hashlib.sha1(repr(versions).encode('utf-8')).hexdigest()[:20]
+    last_modified = datetime.fromtimestamp(int(modified), tz=timezone.utc) if modified else None
+    return etag, last_modified
+
+
+def cache_control(max_age, stale_while_revalidate):
+    return f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+
+
+def not_modified(etag, last_modified):
+    """True if the request's validators match the current version"""
+    if request.if_none_match:
+        # If-None-Match takes precedence over If-Modified-Since
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def conditional(version, max_age=60, stale_while_revalidate=300, per_session=False):
+    """Decorate a GET view with ETag/Last-Modified validators and a Cache-Control policy
+
+    `version` returns (versions, modified): any hashable that changes with
+    the response body, and a Unix timestamp for Last-Modified. Views whose
+    output depends on the session (per_session=True) are only cached for
+    visitors without a session cookie; everyone else gets no-cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not current_app.config.get('HTTP_CACHE', True):
+                return view(*args, **kwargs)
+
+            if per_session and current_app.config['SESSION_COOKIE_NAME'] in request.cookies:
+                response = make_response(view(*args, **kwargs))
+                response.headers['Cache-Control'] = 'private, no-cache'
+                return response
+
+            versions, modified = version()
+            etag, last_modified = validators((request.full_path, versions), modified)
+
+            if not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control(max_age, stale_while_revalidate)
+            if per_session:
+                response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
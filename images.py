@@ -0,0 +1,239 @@
+"""
+Responsive image derivatives
+
+The photos under static/images are multi-megabyte camera originals. This
+module makes resized copies at a fixed set of widths, in the source format
+and as WebP/AVIF, with EXIF and other metadata stripped. Copies are made on
+first request and kept in a disk cache, or ahead of time with:
+
+    python images.py [--widths 320,640,960,1280,1920] [--formats avif,webp]
+
+An AVIF encode of a large photo takes seconds, so each derivative is
+rendered under a lock on its target (a .lock file next to it, shared by
+every worker process): concurrent requests for the same copy wait for one
+render instead of each encoding it again.
+"""
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from PIL import Image, ImageOps, features
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: renders are only serialized within a process
+    fcntl = None
+
+SOURCE_FORMATS = {'.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png'}
+MIMETYPES = {
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+}
+SAVE_OPTIONS = {
+    'jpeg': {'quality': 80, 'optimize': True, 'progressive': True},
+    'png': {'optimize': True},
+    'webp': {'quality': 78, 'method': 4},
+    'avif': {'quality': 60},
+}
+DEFAULT_WIDTHS = (320, 640, 960, 1280, 1920)
+DEFAULT_FORMATS = ('avif', 'webp')
+
+
+def available_formats(formats):
+    """The modern formats this Pillow build can encode, in order of preference"""
+    return tuple(fmt for fmt in formats if features.check(fmt))
+
+
+class ImagePipeline:
+    """Resizes and re-encodes static images on demand, caching the results on disk"""
+
+    def __init__(self, static_dir, cache_dir, widths=DEFAULT_WIDTHS, formats=DEFAULT_FORMATS):
+        self.static_dir = os.path.abspath(static_dir)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.widths = tuple(sorted(set(widths)))
+        self.formats = available_formats(formats)
+        self._info = {}
+        self._lock = threading.Lock()
+        self._target_locks = {}
+        self._stats = {'generated': 0, 'generate_seconds': 0.0}
+
+    def source_path(self, filename):
+        """Absolute path of a static image, or None if it is outside static/ or not an image"""
+        path = os.path.abspath(os.path.join(self.static_dir, filename))
+        if not path.startswith(self.static_dir + os.sep):
+            return None
+        if os.path.splitext(path)[1].lower() not in SOURCE_FORMATS:
+            return None
+        return path
+
+    def info(self, filename):
+        """{'width', 'height', 'format', 'version'} of a static image, or None if unusable"""
+        path = self.source_path(filename)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        cached = self._info.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        try:
+            with Image.open(path) as im:
+                width, height = (im.height, im.width) if _rotated(im) else im.size
+        except OSError:
+            return None
+
+        info = {
+            'width': width,
+            'height': height,
+            'format': SOURCE_FORMATS[os.path.splitext(path)[1].lower()],
+            'version': format(st.st_mtime_ns, 'x'),
+        }
+        self._info[path] = (stamp, info)
+        return info
+
+    def widths_for(self, info):
+        """Derivative widths for an image: the configured widths below its own width,
+        plus its own width (capped at the largest configured width)"""
+        top = min(info['width'], self.widths[-1])
+        return [w for w in self.widths if w < top] + [top]
+
+    def fit_width(self, info, width):
+        """The smallest derivative width at least `width` wide"""
+        candidates = self.widths_for(info)
+        return next((w for w in candidates if w >= width), candidates[-1])
+
+    def derivative(self, filename, width, fmt):
+        """Path of the cached derivative, generating it if needed; None if not allowed"""
+        info = self.info(filename)
+        if info is None or width not in self.widths_for(info):
+            return None
+        if fmt != info['format'] and fmt not in self.formats:
+            return None
+
+        source = self.source_path(filename)
+        target = os.path.join(self.cache_dir, fmt, str(width), os.path.relpath(source, self.static_dir))
+        if _fresh(target, source):
+            return target
+
+        with self._target_lock(target):
+            # Another request may have rendered it while this one waited
+            if _fresh(target, source):
+                return target
+            started = time.perf_counter()
+            self._render(source, target, width, fmt)
+        with self._lock:
+            self._stats['generated'] += 1
+            self._stats['generate_seconds'] += time.perf_counter() - started
+        return target
+
+    @contextmanager
+    def _target_lock(self, target):
+        """Held while `target` is rendered, by one thread of one process at a time"""
+        with self._lock:
+            lock = self._target_locks.setdefault(target, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(f"{target}.lock", 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _render(self, source, target, width, fmt):
+        with Image.open(source) as im:
+            if im.format == 'JPEG':
+                # Let libjpeg decode at a reduced scale; still at least `width` on both sides
+                im.draft('RGB', (width, width))
+            im = ImageOps.exif_transpose(im)
+            if im.width > width:
+                im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+
+            if fmt == 'jpeg' and im.mode not in ('RGB', 'L'):
+                im = im.convert('RGB')
+            elif im.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                im = im.convert('RGBA' if 'transparency' in im.info else 'RGB')
+
+            # Drop EXIF, ICC, comments and the like
+            im.info = {}
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+            im.save(tmp, fmt.upper(), **SAVE_OPTIONS[fmt])
+        os.replace(tmp, target)
+
+    def sources(self):
+        """Relative paths of every image under static_dir"""
+        for root, _, files in os.walk(self.static_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if self.source_path(os.path.relpath(path, self.static_dir)) is not None:
+                    yield os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _fresh(target, source):
+    """True if the derivative exists and is not older than its source"""
+    try:
+        return os.stat(target).st_mtime_ns >= os.stat(source).st_mtime_ns
+    except OSError:
+        return False
+
+
+def _rotated(im):
+    """True if the EXIF orientation swaps width and height"""
+    try:
+        return im.getexif().get(0x0112) in (5, 6, 7, 8)
+    except Exception:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-generate responsive image derivatives")
+    parser.add_argument('--static', default='static', help='static folder to scan')
+    parser.add_argument('--cache-dir', default=os.environ.get('IMAGE_CACHE_DIR', 'image_cache'))
+    parser.add_argument('--prefix', default='images/', help='only images under this path')
+    parser.add_argument('--widths', default=','.join(map(str, DEFAULT_WIDTHS)))
+    parser.add_argument('--formats', default=','.join(DEFAULT_FORMATS))
+    args = parser.parse_args()
+
+    pipeline = ImagePipeline(args.static, args.cache_dir,
+                             widths=[int(w) for w in args.widths.split(',') if w],
+                             formats=[f for f in args.formats.split(',') if f])
+
+    original_bytes = derived_bytes = 0
+    for filename in pipeline.sources():
+        if not filename.startswith(args.prefix):
+            continue
+        info = pipeline.info(filename)
+        if info is None:
+            continue
+        original_bytes += os.path.getsize(pipeline.source_path(filename))
+        for fmt in (info['format'],) + pipeline.formats:
+            for width in pipeline.widths_for(info):
+                derived_bytes += os.path.getsize(pipeline.derivative(filename, width, fmt))
+        print(filename)
+
+    stats = pipeline.stats()
+    print(f"Generated {stats['generated']} derivatives in {stats['generate_seconds']:.1f}s "
+          f"({original_bytes / 1024:.0f} KB of originals, {derived_bytes / 1024:.0f} KB of derivatives)")
+
+
+if __name__ == '__main__':
+    main()
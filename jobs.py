@@ -0,0 +1,272 @@
+"""
+Durable background job queue backed by SQLite
+
+Routes call enqueue() and return immediately; a small pool of worker
+threads in each process claims due jobs from the `jobs` table and runs
+the registered handler. Failed jobs are retried with exponential backoff
+and moved to `dead_jobs` once they run out of attempts.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+
+from database import connect
+
+# Attempts before a job is moved to dead_jobs
+MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+# Retry delay is BACKOFF_BASE * 2**(attempt - 1) seconds, capped at BACKOFF_MAX
+BACKOFF_BASE = float(os.environ.get('JOB_BACKOFF_BASE', 5))
+BACKOFF_MAX = float(os.environ.get('JOB_BACKOFF_MAX', 3600))
+# Seconds an idle worker sleeps before polling again
+POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+# A running job whose worker stopped renewing its lock is taken over after
+# this many seconds; workers renew the lock every LOCK_TIMEOUT / 3 while a
+# job runs, so long jobs (full-year exports) keep it
+LOCK_TIMEOUT = float(os.environ.get('JOB_LOCK_TIMEOUT', 300))
+
+HANDLERS = {}
+# kind -> payload fields that must not outlive the job (OTPs and the like)
+SENSITIVE_FIELDS = {}
+REDACTED = '[redacted]'
+
+_wakeup = threading.Event()
+
+
+def handler(kind, sensitive=()):
+    """Register a function as the handler for jobs of `kind`; it is called with **payload
+
+    `sensitive` payload fields are redacted before a failed job is kept in
+    dead_jobs; finished jobs are deleted with secure_delete on.
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        SENSITIVE_FIELDS[kind] = tuple(sensitive)
+        return func
+    return register
+
+
+def scrub(kind, payload):
+    """The JSON payload with the kind's sensitive fields redacted"""
+    fields = SENSITIVE_FIELDS.get(kind)
+    if not fields:
+        return payload
+    data = json.loads(payload)
+    for field in fields:
+        if field in data:
+            data[field] = REDACTED
+    return json.dumps(data)
+
+
+def enqueue(kind, payload, max_attempts=MAX_ATTEMPTS, delay=0):
+    """Persist a job and return its id"""
+    conn = connect()
+    try:
+        cur = conn.execute("""
+            INSERT INTO jobs (kind, payload, max_attempts, run_at, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (kind, json.dumps(payload), max_attempts, time.time() + delay,
+              datetime.now().isoformat()))
+        conn.commit()
+        job_id = cur.lastrowid
+    finally:
+        conn.close()
+
+    _wakeup.set()
+    return job_id
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim(conn, worker_id):
+    """Lock the next due job for this worker, or return None
+
+    An idle poll is a plain read; the write lock is only taken to claim a
+    job that exists, with a compare-and-set so two workers racing for the
+    same job cannot both get it.
+    """
+    now = time.time()
+    candidates = conn.execute("""
+        SELECT id, status, locked_by, locked_at FROM jobs
+        WHERE (status = 'queued' AND run_at <= ?)
+           OR (status = 'running' AND locked_at < ?)
+        ORDER BY run_at
+        LIMIT 5
+    """, (now, now - LOCK_TIMEOUT)).fetchall()
+
+    for candidate in candidates:
+        stale = candidate['status'] == 'running'
+        try:
+            claimed = conn.execute("""
+                UPDATE jobs SET status = 'running', locked_by = ?, locked_at = ?
+                WHERE id = ? AND status = ? AND locked_at IS ?
+            """, (worker_id, now, candidate['id'], candidate['status'], candidate['locked_at'])).rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if not claimed:
+            continue
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (candidate['id'],)).fetchone()
+        if not stale:
+            return job
+        # Its worker died mid-run: that counts as a failed attempt, so a job
+        # with no attempts left (max_attempts=1 exports) is dead-lettered, not rerun
+        fail(conn, job, f"lock expired; worker {candidate['locked_by']} lost")
+    return None
+
+
+@contextmanager
+def heartbeat(job, worker_id, interval=None):
+    """Renew the job's lock in the background while the body runs"""
+    interval = interval if interval is not None else LOCK_TIMEOUT / 3
+    stop = threading.Event()
+
+    def renew():
+        conn = None
+        try:
+            while not stop.wait(interval):
+                # Most jobs finish long before the first renewal; connect only when needed
+                if conn is None:
+                    conn = connect()
+                conn.execute("UPDATE jobs SET locked_at = ? WHERE id = ? AND locked_by = ?",
+                             (time.time(), job['id'], worker_id))
+                conn.commit()
+        finally:
+            if conn is not None:
+                conn.close()
+
+    thread = threading.Thread(target=renew, name=f"job-heartbeat-{job['id']}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def complete(conn, job):
+    conn.execute("DELETE FROM jobs WHERE id = ?", (job['id'],))
+    conn.commit()
+
+
+def fail(conn, job, error):
+    """Schedule a retry, or move the job to dead_jobs once attempts run out"""
+    attempts = job['attempts'] + 1
+
+    if attempts >= job['max_attempts']:
+        conn.execute("""
+            INSERT OR REPLACE INTO dead_jobs (id, kind, payload, attempts, last_error, created_at, failed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (job['id'], job['kind'], scrub(job['kind'], job['payload']), attempts, error,
+              job['created_at'], datetime.now().isoformat()))
+        conn.execute("DELETE FROM jobs WHERE id = ?", (job['id'],))
+    else:
+        conn.execute("""
+            UPDATE jobs
+            SET status = 'queued', attempts = ?, run_at = ?, last_error = ?,
+                locked_by = NULL, locked_at = NULL
+            WHERE id = ?
+        """, (attempts, time.time() + backoff(attempts), error, job['id']))
+    conn.commit()
+
+
+def run_job(job):
+    func = HANDLERS.get(job['kind'])
+    if func is None:
+        raise LookupError(f"no handler registered for job kind {job['kind']!r}")
+    func(**json.loads(job['payload']))
+
+
+def run_pending(app, worker_id='inline', limit=None):
+    """Run due jobs in the calling thread until none are left; returns how many ran"""
+    conn = connect()
+    # Deleted jobs (OTPs, email addresses) are overwritten rather than left in free pages
+    conn.execute("PRAGMA secure_delete = ON")
+    ran = 0
+    try:
+        while limit is None or ran < limit:
+            job = claim(conn, worker_id)
+            if job is None:
+                break
+            try:
+                with heartbeat(job, worker_id), app.app_context():
+                    run_job(job)
+            except Exception:
+                app.logger.error(f"Job {job['id']} ({job['kind']}) failed: {traceback.format_exc()}")
+                fail(conn, job, traceback.format_exc(limit=5))
+            else:
+                complete(conn, job)
+            ran += 1
+    finally:
+        conn.close()
+    return ran
+
+
+def queue_depth():
+    """Number of queued, running and dead-lettered jobs"""
+    conn = connect()
+    try:
+        depth = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        depth['dead'] = conn.execute("SELECT COUNT(*) FROM dead_jobs").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        'queued': depth.get('queued', 0),
+        'running': depth.get('running', 0),
+        'dead': depth['dead'],
+    }
+
+
+class WorkerPool:
+    """Background threads that drain the job queue for one process"""
+
+    def __init__(self, app, size):
+        self.app = app
+        self.size = size
+        self.pid = None
+        self._threads = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the threads in this process (again after a fork)"""
+        if self.pid == os.getpid() or self.size <= 0:
+            return
+        with self._lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self._stopping.clear()
+            self._threads = []
+            for n in range(self.size):
+                worker_id = f"{socket.gethostname()}:{self.pid}:{n}"
+                thread = threading.Thread(target=self._run, args=(worker_id,),
+                                          name=f"job-worker-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        _wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self.pid = None
+
+    def _run(self, worker_id):
+        while not self._stopping.is_set():
+            try:
+                ran = run_pending(self.app, worker_id)
+            except Exception:
+                self.app.logger.error(f"Job worker {worker_id} crashed: {traceback.format_exc()}")
+                ran = 0
+            if not ran:
+                _wakeup.wait(POLL_INTERVAL)
+                _wakeup.clear()
@@ -0,0 +1,61 @@
+"""
+Pre-encoded JSON response bodies
+
+The /api endpoints serve documents that only change when a data file
+changes, so each one is encoded to bytes (and gzipped) once per data
+version and the same bytes are returned on every request. orjson is used
+when installed; otherwise the stdlib encoder produces the same output as
+Flask's jsonify.
+"""
+import gzip
+import json
+
+from flask import current_app, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKENDS = ('orjson', 'json')
+
+
+def default_backend():
+    return 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj, backend=None):
+    """Encode obj to compact, key-sorted JSON bytes with a trailing newline"""
+    backend = backend or default_backend()
+    if backend == 'orjson':
+        if orjson is None:
+            raise RuntimeError('orjson is not installed')
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':')) + '\n').encode('ascii')
+
+
+class JSONBody:
+    """A JSON document encoded once, with an optional gzipped copy"""
+
+    __slots__ = ('raw', 'gzipped')
+
+    def __init__(self, obj, backend=None, compress=True, level=6):
+        self.raw = dumps(obj, backend)
+        self.gzipped = None
+        if compress:
+            # mtime=0 keeps the gzip bytes identical for identical JSON
+            gzipped = gzip.compress(self.raw, compresslevel=level, mtime=0)
+            if len(gzipped) < len(self.raw):
+                self.gzipped = gzipped
+
+    def response(self, status=200):
+        """A response carrying the stored bytes, gzipped if the client accepts it"""
+        response = current_app.response_class(status=status, mimetype='application/json')
+        if self.gzipped is not None and request.accept_encodings['gzip'] > 0:
+            response.set_data(self.gzipped)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response.set_data(self.raw)
+        if self.gzipped is not None:
+            response.vary.add('Accept-Encoding')
+        return response
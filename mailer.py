@@ -0,0 +1,137 @@
+"""
+Pooled SMTP transport for Flask-Mail
+
+Flask-Mail's mail.send() opens a new SMTP connection (TLS handshake and
+login included) for every message. MailTransport keeps a few logged-in
+connections warm, sends single messages and whole batches over them, and
+reconnects once if the server has dropped a connection.
+"""
+import queue
+import smtplib
+import threading
+import time
+
+from flask_mail import Connection
+
+# Errors after which a connection is thrown away and the send retried once.
+# Not OSError: every SMTPException is one, and permanent failures such as
+# SMTPRecipientsRefused or SMTPAuthenticationError must not be resent.
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+
+class MailTransport:
+    """Warm pool of Flask-Mail SMTP connections with per-send latency counters"""
+
+    def __init__(self, app, pool_size=2, idle_timeout=60):
+        self.app = app
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._stats = {
+            'sent': 0,
+            'failed': 0,
+            'batches': 0,
+            'connections_opened': 0,
+            'reconnects': 0,
+            'latency_ms_total': 0.0,
+            'latency_ms_max': 0.0,
+        }
+
+    def _open(self):
+        conn = Connection(self.app.extensions['mail']).__enter__()
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.__exit__(None, None, None)
+        except Exception:
+            pass
+
+    def _acquire(self):
+        """Return a warm connection, discarding any that sat idle too long"""
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._open()
+            if time.monotonic() - last_used < self.idle_timeout:
+                return conn
+            self._close(conn)
+
+    def _release(self, conn):
+        if self._idle.qsize() < self.pool_size:
+            self._idle.put((conn, time.monotonic()))
+        else:
+            self._close(conn)
+
+    def _send_one(self, conn, msg):
+        """Send over `conn`, reconnecting once on a dropped connection
+
+        Returns the connection that is still usable. On failure the
+        connection is closed before the error is re-raised.
+        """
+        started = time.perf_counter()
+        try:
+            try:
+                conn.send(msg)
+            except RECONNECT_ERRORS:
+                self._close(conn)
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                conn = self._open()
+                conn.send(msg)
+        except Exception:
+            self._close(conn)
+            with self._lock:
+                self._stats['failed'] += 1
+            raise
+
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._stats['sent'] += 1
+            self._stats['latency_ms_total'] += elapsed
+            self._stats['latency_ms_max'] = max(self._stats['latency_ms_max'], elapsed)
+        return conn
+
+    def send(self, msg):
+        """Send one message over a pooled connection"""
+        conn = self._send_one(self._acquire(), msg)
+        self._release(conn)
+
+    def send_batch(self, messages):
+        """Send many messages over one SMTP session; returns the messages that failed"""
+        failed = []
+        conn = None
+        with self._lock:
+            self._stats['batches'] += 1
+        for msg in messages:
+            try:
+                if conn is None:
+                    conn = self._acquire()
+                conn = self._send_one(conn, msg)
+            except Exception:
+                failed.append(msg)
+                # The rest of the batch starts on a fresh session
+                conn = None
+        if conn is not None:
+            self._release(conn)
+        return failed
+
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['idle_connections'] = self._idle.qsize()
+        stats['latency_ms_avg'] = stats['latency_ms_total'] / stats['sent'] if stats['sent'] else 0.0
+        return stats
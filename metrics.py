@@ -0,0 +1,264 @@
+"""
+Prometheus metrics shared across gunicorn workers
+
+Each worker keeps its counters and histograms in memory and, when
+METRICS_DIR is set, writes a snapshot of them to its own file in that
+directory at most every flush_interval seconds. /metrics, served by any
+worker, adds up every file so one scrape covers the whole deployment;
+nothing has to reach each worker separately. Files of workers that have
+exited are kept so counters never go backwards; clear METRICS_DIR when
+the server (not a worker) starts.
+
+Gauges are read when the page is scraped (queue depth, for example).
+Per-process gauges (connection pool size) are written with the snapshot
+and added up over the workers that are still running.
+Ratios are left to PromQL, e.g. the data file cache hit ratio:
+
+    sum(rate(content_cache_lookups_total{result="hit"}[5m]))
+      / sum(rate(content_cache_lookups_total[5m]))
+"""
+import atexit
+import bisect
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+# Seconds; covers fast cached pages through slow PDF renders and SMTP sends
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self.registry._lock:
+            values = self.registry._series(self.name)
+            values[key] = values.get(key, 0) + amount
+
+
+class Histogram:
+    def __init__(self, registry, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry._lock:
+            values = self.registry._series(self.name)
+            series = values.get(key)
+            if series is None:
+                # [count per bucket (last is +Inf), sum]
+                series = values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+
+class Gauge:
+    def __init__(self, registry, name, help, fn, labelnames=(), per_process=False):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.per_process = per_process
+
+
+class Registry:
+    """Counters and histograms of this process, merged with the other workers' snapshots"""
+
+    def __init__(self, directory=None, flush_interval=1.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._metrics = {}
+        # name: fn() -> value or {label values: value}, for per-process counters
+        # and gauges kept elsewhere; written with the snapshot
+        self._callbacks = {}
+        self._reset()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._values = {}
+        self._last_flush = 0.0
+        # Not just the pid: pids are reused, and a reused pid must not overwrite a dead worker's counts
+        self._filename = f"{self._pid}-{uuid.uuid4().hex[:8]}.json"
+
+    def _check_pid(self):
+        # Called with the lock held. A forked child starts from zero with its own file.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _series(self, name):
+        self._check_pid()
+        return self._values.setdefault(name, {})
+
+    # Definitions
+
+    def counter(self, name, help, labelnames=()):
+        return self._define(Counter(self, name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._define(Histogram(self, name, help, labelnames, buckets))
+
+    def counter_callback(self, name, help, fn, labelnames=()):
+        """A counter this process already keeps elsewhere, such as a cache's hit count"""
+        self._define(Counter(self, name, help, labelnames))
+        self._callbacks[name] = fn
+
+    def gauge(self, name, help, fn, labelnames=()):
+        """fn() -> value or {label values: value}, read when /metrics is scraped; not summed across workers"""
+        return self._define(Gauge(self, name, help, fn, labelnames))
+
+    def process_gauge(self, name, help, fn, labelnames=()):
+        """fn() -> value or {label values: value} for this process, summed over live workers"""
+        self._callbacks[name] = fn
+        return self._define(Gauge(self, name, help, fn, labelnames, per_process=True))
+
+    def _define(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    # Snapshots
+
+    def snapshot(self):
+        """This process's counters and histograms as {name: {label values: value}}"""
+        with self._lock:
+            self._check_pid()
+            values = {}
+            for name, series in self._values.items():
+                if isinstance(self._metrics[name], Histogram):
+                    values[name] = {key: [list(buckets), total] for key, (buckets, total) in series.items()}
+                else:
+                    values[name] = dict(series)
+        for name, fn in self._callbacks.items():
+            values[name] = _as_series(fn())
+        return values
+
+    def maybe_flush(self):
+        """Write this process's snapshot if the last one is older than flush_interval"""
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.directory:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            snapshot = {name: [[list(key), value] for key, value in series.items()]
+                        for name, series in self.snapshot().items()}
+            path = os.path.join(self.directory, self._filename)
+            tmp = f"{path}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, path)
+
+    def collect(self):
+        """Every worker's counters and histograms added together"""
+        merged = self.snapshot()
+        if not self.directory:
+            return merged
+        self.flush()
+        # _filename is read after flush(), which may have just reset it in a forked child
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == self._filename:
+                continue
+            try:
+                with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _alive(filename)
+            for name, series in snapshot.items():
+                metric = self._metrics.get(name)
+                if metric is None or (isinstance(metric, Gauge) and not alive):
+                    continue
+                target = merged.setdefault(name, {})
+                for key, value in series:
+                    _merge(target, tuple(key), value)
+        return merged
+
+    # Exposition
+
+    def render(self):
+        """The Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if isinstance(metric, Gauge):
+                kind, series = 'gauge', merged.get(name, {}) if metric.per_process else _as_series(metric.fn())
+            else:
+                kind, series = ('histogram' if isinstance(metric, Histogram) else 'counter'), merged.get(name, {})
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, value in sorted(series.items()):
+                labels = list(zip(metric.labelnames, key))
+                if kind != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                buckets, total = value
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), buckets):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(bound)
+                    lines.append(f"{name}_bucket{_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(filename):
+    """Whether the worker that wrote a snapshot file (named <pid>-...) is still running"""
+    try:
+        os.kill(int(filename.split('-', 1)[0]), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _as_series(value):
+    return value if isinstance(value, dict) else {(): value}
+
+
+def _merge(target, key, value):
+    current = target.get(key)
+    if current is None:
+        target[key] = value
+    elif isinstance(value, list):
+        target[key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1]]
+    else:
+        target[key] = current + value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
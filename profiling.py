@@ -0,0 +1,200 @@
+"""
+Per-request phase timings and on-demand profiles
+
+Time spent in SQLite, JSON loading, template rendering, PDF rendering and
+SMTP is added up per request and sent back in a Server-Timing header, e.g.
+
+    Server-Timing: db;dur=3.1;desc="SQLite x4", render;dur=7.9, total;dur=12.6
+
+which browser dev tools show next to the network timings. The header
+gives away how the site is built, so the app sends it only to requests
+allow_server_timing approves (admins, by default). The same phases
+are also totalled per process (phase_stats()), including work done outside
+requests, such as emails sent by the job workers.
+
+An admin can profile a single request by sending `X-Profile: 1` (or
+`X-Profile: cprofile` / `pyinstrument`). The profile is saved under
+logs/profiles/ and its file name returned in an X-Profile-File header.
+pyinstrument, a sampling profiler, is used when it is installed; cProfile
+otherwise. Open .prof files with `python -m pstats` or snakeviz.
+"""
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+
+import database
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+PROFILE_HEADER = 'X-Profile'
+PHASE_DESCRIPTIONS = {
+    'db': 'SQLite',
+    'json': 'JSON data',
+    'render': 'Templates',
+    'pdf': 'PDF',
+    'mail': 'SMTP',
+}
+
+# Called as hook(phase, seconds) for every recorded phase (metrics)
+phase_hooks = []
+
+_lock = threading.Lock()
+_totals = {}
+
+
+def record(phase, seconds):
+    """Add seconds to `phase` for this process and, inside a request, for the request"""
+    with _lock:
+        total = _totals.setdefault(phase, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+        total['count'] += 1
+        total['seconds'] += seconds
+        total['max'] = max(total['max'], seconds)
+    for hook in phase_hooks:
+        hook(phase, seconds)
+
+    if has_request_context() and 'phase_timings' in g:
+        timing = g.phase_timings.setdefault(phase, [0, 0.0])
+        timing[0] += 1
+        timing[1] += seconds
+
+
+@contextmanager
+def phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Decorate a function so its calls count towards phase `name`"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def phase_stats():
+    """{phase: {count, seconds, max}} totalled over this process's lifetime"""
+    with _lock:
+        return {name: dict(total) for name, total in _totals.items()}
+
+
+def server_timing(timings, total):
+    """Server-Timing header value for {phase: [count, seconds]} and the request total"""
+    metrics = []
+    for name, (count, seconds) in sorted(timings.items()):
+        desc = PHASE_DESCRIPTIONS.get(name, name)
+        metrics.append(f'{name};dur={seconds * 1000:.1f};desc="{desc} x{count}"')
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+class RequestProfiler:
+    """Phase timings for every request, and profiles for the ones an admin asks for"""
+
+    def __init__(self, app=None, profile_dir=os.path.join('logs', 'profiles'), server_timing=True,
+                 allow_profile=None, allow_server_timing=None):
+        self.profile_dir = profile_dir
+        self.server_timing = server_timing
+        # Called inside the request; only requests they approve may be profiled
+        # or get a Server-Timing header
+        self.allow_profile = allow_profile or (lambda: False)
+        self.allow_server_timing = allow_server_timing or (lambda: True)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        before_render_template.connect(self._render_started, app, weak=False)
+        template_rendered.connect(self._render_finished, app, weak=False)
+        database.query_hooks.append(self._query)
+
+    # Hooks
+
+    def _start(self):
+        g.request_started = time.perf_counter()
+        g.phase_timings = {}
+        mode = request.headers.get(PROFILE_HEADER)
+        if mode and self.allow_profile():
+            g.profiler = self._start_profiler(mode)
+
+    def _finish(self, response):
+        if 'request_started' not in g:
+            return response
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            response.headers['X-Profile-File'] = self._save_profile(profiler)
+        if self.server_timing and self.allow_server_timing():
+            total = time.perf_counter() - g.request_started
+            response.headers['Server-Timing'] = server_timing(g.phase_timings, total)
+        return response
+
+    def _teardown(self, exception=None):
+        # after_request does not run for some failures; never leave a profiler on
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            self._stop_profiler(profiler)
+
+    def _query(self, sql, params, seconds):
+        record('db', seconds)
+
+    def _render_started(self, app, template, context, **extra):
+        if has_request_context():
+            g.setdefault('render_stack', []).append(time.perf_counter())
+
+    def _render_finished(self, app, template, context, **extra):
+        stack = g.get('render_stack') if has_request_context() else None
+        if stack:
+            started = stack.pop()
+            # Templates rendered while another is rendering count once, in the outer one
+            if not stack:
+                record('render', time.perf_counter() - started)
+
+    # Profiles
+
+    def _start_profiler(self, mode):
+        if mode.lower() != 'cprofile' and pyinstrument is not None:
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, profiler):
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        elif profiler.is_running:
+            profiler.stop()
+
+    def _save_profile(self, profiler):
+        self._stop_profiler(profiler)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        endpoint = re.sub(r'[^A-Za-z0-9_.-]', '_', request.endpoint or 'unknown')
+        elapsed_ms = (time.perf_counter() - g.request_started) * 1000
+        stem = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{endpoint}-{elapsed_ms:.0f}ms"
+        if isinstance(profiler, cProfile.Profile):
+            filename = stem + '.prof'
+            profiler.dump_stats(os.path.join(self.profile_dir, filename))
+        else:
+            filename = stem + '.html'
+            with open(os.path.join(self.profile_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+        return filename
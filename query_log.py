@@ -0,0 +1,208 @@
+"""
+Slow query log for the SQLite statements run by requests
+
+Registered as a database.query_hooks callback. Statements slower than the
+threshold are appended to a JSON-lines log shared by all workers, with
+their literals and parameters redacted and, the first time each statement
+is seen by a process, its EXPLAIN QUERY PLAN. The plan and the write happen
+on a background thread, never in the request. Once the log reaches
+max_bytes it is renamed to <log>.1 (replacing the previous one) and a new
+one started. The report groups both files by normalized statement and
+flags full table scans:
+
+    python query_log.py report [--log logs/slow_queries.log] [--sort total|count|max] [--limit 20] [--plans]
+"""
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+from datetime import datetime
+
+import database
+
+# Statements that have a query plan worth capturing
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.S)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.I)
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """The statement with comments, literals and IN-list lengths taken out"""
+    sql = _COMMENT.sub(' ', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def redact(params):
+    """Parameter types only, never values"""
+    if params is None:
+        return 'executemany'
+    if isinstance(params, dict):
+        return {name: type(value).__name__ for name, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+
+def full_scans(plan):
+    """Plan steps that walk a whole table or index (SCAN) rather than searching it (SEARCH)
+
+    A SCAN ... USING COVERING INDEX still reads every entry; only a LIMIT
+    stops a scan early.
+    """
+    return [step for step in plan if step.startswith('SCAN ') and step != 'SCAN CONSTANT ROW']
+
+
+class SlowQueryLog:
+    """database.query_hooks callback that logs statements over threshold_ms"""
+
+    def __init__(self, path=os.path.join('logs', 'slow_queries.log'), threshold_ms=50, explain=True, logger=None,
+                 max_bytes=10 * 1024 * 1024, max_pending=1000):
+        self.path = path
+        self.logger = logger
+        self.threshold = threshold_ms / 1000
+        self.explain = explain
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        # normalized statement -> plan steps, so each is explained once per process
+        self._plans = {}
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's thread and queue are gone
+            self._queue = queue.Queue(self.max_pending)
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='slow-query-log', daemon=True).start()
+
+    def __call__(self, sql, params, seconds):
+        if seconds < self.threshold:
+            return
+        self._ensure_started()
+        entry = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'pid': os.getpid(),
+            'ms': round(seconds * 1000, 3),
+        }
+        try:
+            self._queue.put_nowait((entry, sql, params))
+        except queue.Full:
+            # A flood of slow queries must not back up into the requests
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            entry, sql, params = self._queue.get()
+            try:
+                self.write(entry, sql, params)
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"Slow query log: {e}")
+
+    def write(self, entry, sql, params):
+        """Complete an entry (statement, redacted params, first plan) and append it"""
+        statement = entry['statement'] = normalize(sql)
+        entry['params'] = redact(params)
+        if self.explain and statement not in self._plans:
+            self._plans[statement] = entry['plan'] = self.query_plan(sql, params)
+        if self.logger is not None:
+            self.logger.warning(f"Slow query ({entry['ms']:.1f} ms): {statement}")
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def _rotate(self):
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+            os.replace(self.path, self.path + '.1')
+        except FileNotFoundError:
+            # Not created yet, or another worker has just rotated it
+            pass
+
+    def query_plan(self, sql, params):
+        """EXPLAIN QUERY PLAN detail lines, on a separate connection so the request's transaction is untouched"""
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        conn = database.connect()
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params if params is not None else ()).fetchall()
+            return [row['detail'] for row in rows]
+        except Exception as e:
+            return [f"(no plan: {e})"]
+        finally:
+            conn.close()
+
+
+def read_log(path):
+    """Entries of the rotated-out log (<path>.1), then the current one"""
+    for name in (path + '.1', path):
+        if not os.path.exists(name):
+            continue
+        with open(name, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def aggregate(entries):
+    """Group log entries by normalized statement: count, total/max ms and the latest plan"""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['statement'], {
+            'statement': entry['statement'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'last_seen': None, 'plan': [],
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['last_seen'] = entry['time']
+        if entry.get('plan'):
+            group['plan'] = entry['plan']
+    for group in groups.values():
+        group['avg_ms'] = group['total_ms'] / group['count']
+        group['full_scans'] = full_scans(group['plan'])
+    return list(groups.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Slow SQLite statements grouped by normalized statement")
+    parser.add_argument('command', choices=['report'])
+    parser.add_argument('--log', default=os.environ.get('SLOW_QUERY_LOG', os.path.join('logs', 'slow_queries.log')))
+    parser.add_argument('--sort', choices=['total', 'count', 'max', 'avg'], default='total')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--plans', action='store_true', help='print every query plan, not just full scans')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.log) and not os.path.exists(args.log + '.1'):
+        print(f"No slow queries logged yet ({args.log} does not exist)")
+        return
+
+    key = {'total': 'total_ms', 'count': 'count', 'max': 'max_ms', 'avg': 'avg_ms'}[args.sort]
+    groups = sorted(aggregate(read_log(args.log)), key=lambda g: g[key], reverse=True)[:args.limit]
+    print(f"{'count':>7} {'total ms':>10} {'avg ms':>8} {'max ms':>8}  statement")
+    for group in groups:
+        flag = '  [FULL SCAN]' if group['full_scans'] else ''
+        print(f"{group['count']:>7} {group['total_ms']:>10.1f} {group['avg_ms']:>8.1f} {group['max_ms']:>8.1f}  "
+              f"{group['statement']}{flag}")
+        for step in group['plan'] if args.plans else group['full_scans']:
+            print(f"{'':>37}  -> {step}")
+
+
+if __name__ == '__main__':
+    main()
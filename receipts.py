@@ -0,0 +1,178 @@
+"""
+Donation receipt PDFs
+
+The static part of the receipt (title, rule and organization block) is
+compiled to PDF operators once per process and pasted into every receipt,
+so only the per-donation fields are laid out for each render. Rendering
+can run in a process pool, and finished PDFs are cached by donation_id
+for re-downloads.
+"""
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from werkzeug.utils import secure_filename
+
+ORGANIZATION_LINES = [
+    "Smiling Tears Foundation",
+    "Reg. No: 1234",
+    "Address: Laxmi Nagar, Delhi",
+    "Contact: 9009664469",
+    "Email: smilingtearsfoundation@gmail.com",
+]
+
+_static_code = None
+
+
+def _new_canvas(buffer):
+    return canvas.Canvas(buffer, pagesize=letter)
+
+
+def _compile_static():
+    """PDF operators for everything on the receipt that never changes"""
+    text = _new_canvas(BytesIO()).beginText()
+
+    text.setFont("Helvetica-Bold", 16)
+    text.setTextOrigin(200, 750)
+    text.textOut("Donation Receipt")
+
+    text.setFont("Helvetica-Bold", 12)
+    text.setTextOrigin(50, 560)
+    text.textOut("Organization Details:")
+
+    text.setFont("Helvetica", 11)
+    for i, line in enumerate(ORGANIZATION_LINES):
+        text.setTextOrigin(50, 540 - 15 * i)
+        text.textOut(line)
+
+    # Horizontal rule between the donation fields and the organization block
+    return text.getCode() + " 50 580 m 550 580 l S"
+
+
+def receipt_lines(receipt):
+    """The per-donation lines of a receipt"""
+    return [
+        f"Receipt ID: {receipt['donation_id']}",
+        f"Date: {receipt['date']}",
+        f"Name: {receipt['name']}",
+        f"Email: {receipt['email']}",
+        f"Phone: {receipt['phone']}",
+        f"Program: {receipt['program']}",
+        f"Amount Donated: ₹{receipt['amount']}",
+    ]
+
+
+def render_receipt(receipt):
+    """Render one receipt dict to PDF bytes"""
+    global _static_code
+    if _static_code is None:
+        _static_code = _compile_static()
+
+    buffer = BytesIO()
+    c = _new_canvas(buffer)
+
+    # Use the bold face first, as the template canvas did, so the font
+    # resource names in the precompiled operators match this document
+    c.setFont("Helvetica-Bold", 16)
+    c.addLiteral(_static_code)
+
+    c.setFont("Helvetica", 12)
+    for i, line in enumerate(receipt_lines(receipt)):
+        c.drawString(50, 720 - 20 * i, line)
+
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+class ReceiptRenderer:
+    """Renders receipts inline or in a process pool, caching them by donation_id"""
+
+    def __init__(self, workers=0, cache_size=256, cache_dir=None):
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._stats = {'rendered': 0, 'cache_hits': 0}
+
+    def _executor(self):
+        """The process pool, or None when rendering inline"""
+        if self.workers <= 0:
+            return None
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                # spawn, not fork: the web process has job and pool threads running
+                self._pool = ProcessPoolExecutor(self.workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _cache_path(self, donation_id):
+        return os.path.join(self.cache_dir, f"{secure_filename(str(donation_id))}.pdf")
+
+    def cached(self, donation_id):
+        """Return a cached PDF for donation_id, or None"""
+        with self._lock:
+            pdf = self._cache.get(donation_id)
+            if pdf is not None:
+                self._cache.move_to_end(donation_id)
+                self._stats['cache_hits'] += 1
+                return pdf
+
+        if self.cache_dir:
+            try:
+                with open(self._cache_path(donation_id), 'rb') as f:
+                    pdf = f.read()
+            except OSError:
+                return None
+            self._remember(donation_id, pdf, write=False)
+            with self._lock:
+                self._stats['cache_hits'] += 1
+        return pdf
+
+    def _remember(self, donation_id, pdf, write=True):
+        with self._lock:
+            self._cache[donation_id] = pdf
+            self._cache.move_to_end(donation_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        if write and self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._cache_path(donation_id)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(pdf)
+            os.replace(tmp, path)
+
+    def render(self, receipt):
+        """Return the PDF for a receipt, from the cache when possible"""
+        donation_id = receipt['donation_id']
+        pdf = self.cached(donation_id)
+        if pdf is not None:
+            return pdf
+
+        executor = self._executor()
+        if executor is None:
+            pdf = render_receipt(receipt)
+        else:
+            pdf = executor.submit(render_receipt, receipt).result()
+
+        with self._lock:
+            self._stats['rendered'] += 1
+        self._remember(donation_id, pdf)
+        return pdf
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached'] = len(self._cache)
+        return stats
@@ -110,10 +110,24 @@ static/uploads/*
 
 # Database
 *.db
+*.db-wal
+*.db-shm
 *.sqlite
 
 # Backups
 backups/
+
+# Receipt / statement exports
+exports/
+
+# Resized image derivatives
+image_cache/
+
+# Fingerprinted static assets (python assets.py build)
+static_build/
+
+# Synthetic datasets (python -m benchmarks.synthetic)
+synthetic/
 """
     
     with open('.gitignore', 'w') as f:
@@ -256,7 +270,6 @@ def create_sample_json_files():
         'blog-posts.json': {"posts": []},
         'testimonials.json': {"testimonials": []},
         'team-members.json': {"team": []},
-        'contact_submissions.json': {"submissions": []},
         'volunteer_applications.json': {"applications": []},
         'donations.json': {"donations": []}
     }
@@ -0,0 +1,290 @@
+"""
+Bulk receipt regeneration and year-end 80G statement export
+
+Donations are streamed from SQLite in chunks, rendered in parallel across
+a process pool with a bounded number of PDFs in flight, and written to a
+ZIP file or a directory as they complete, so memory use does not grow
+with the number of donations.
+
+    python statements.py statements --fy 2024 --out statements-FY2024-25.zip
+    python statements.py receipts --from 2024-04-01 --to 2025-03-31 --out receipts/
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from io import BytesIO
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+from werkzeug.utils import secure_filename
+
+from database import connect
+from receipts import ORGANIZATION_LINES, render_receipt
+
+# Rows fetched from SQLite per round trip
+CHUNK_SIZE = 500
+
+
+def financial_year(start_year):
+    """(first day, day after last day, label) of the Indian financial year starting in April"""
+    return (date(start_year, 4, 1), date(start_year + 1, 4, 1),
+            f"FY{start_year}-{str(start_year + 1)[-2:]}")
+
+
+def iter_donations(conn, start, end, by_donor=False, chunk_size=CHUNK_SIZE):
+    """Yield successful donations with start <= timestamp < end, by id or by (donor_email, id)
+
+    Each chunk is its own query resuming after the last row of the previous
+    one, along the primary key or idx_donations_donor_email, so SQLite never
+    sorts the range; with temp_store=MEMORY that sort held the whole year in
+    RAM. The unary + keeps the planner off the timestamp index, which would
+    need that sort.
+    """
+    if by_donor:
+        after, order_by, key = "(donor_email, id) > (?, ?)", "donor_email, id", ('', 0)
+    else:
+        after, order_by, key = "id > ?", "id", (0,)
+    while True:
+        rows = conn.execute(f"""
+            SELECT * FROM donations
+            WHERE status = 'success' AND +timestamp >= ? AND +timestamp < ? AND {after}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, (start.isoformat(), end.isoformat(), *key, chunk_size)).fetchall()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+        key = (last['donor_email'], last['id']) if by_donor else (last['id'],)
+
+
+def iter_statements(conn, start, end, label, chunk_size=CHUNK_SIZE):
+    """Group the donation stream into one statement per donor email"""
+    statement = None
+    for row in iter_donations(conn, start, end, True, chunk_size):
+        if not row['donor_email']:
+            continue
+
+        if statement is None or statement['donor_email'] != row['donor_email']:
+            if statement is not None:
+                yield statement
+            statement = {
+                'label': label,
+                'donor_email': row['donor_email'],
+                'donor_name': 'Anonymous',
+                'donor_phone': row['donor_phone'],
+                'donations': [],
+                'total': 0.0,
+            }
+
+        if row['donor_name'] and not row['is_anonymous']:
+            statement['donor_name'] = row['donor_name']
+        statement['donations'].append({
+            'donation_id': row['donation_id'],
+            'date': row['timestamp'][:10],
+            'program': row['program'],
+            'amount': row['amount'] or 0,
+        })
+        statement['total'] += row['amount'] or 0
+
+    if statement is not None:
+        yield statement
+
+
+def render_statement(statement):
+    """Render a donor's annual 80G statement; returns (filename, pdf bytes)"""
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+
+    def header():
+        c.setFont("Helvetica-Bold", 16)
+        c.drawString(160, 750, f"Annual Donation Statement {statement['label']}")
+        c.setFont("Helvetica", 12)
+        c.drawString(50, 720, f"Donor: {statement['donor_name']}")
+        c.drawString(50, 700, f"Email: {statement['donor_email']}")
+        c.drawString(50, 680, f"Phone: {statement['donor_phone'] or ''}")
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(50, 650, "Receipt ID")
+        c.drawString(220, 650, "Date")
+        c.drawString(320, 650, "Program")
+        c.drawRightString(550, 650, "Amount")
+        c.line(50, 645, 550, 645)
+        c.setFont("Helvetica", 11)
+        return 630
+
+    y = header()
+    for donation in statement['donations']:
+        if y < 180:
+            c.showPage()
+            y = header()
+        c.drawString(50, y, str(donation['donation_id']))
+        c.drawString(220, y, donation['date'])
+        c.drawString(320, y, str(donation['program'] or ''))
+        c.drawRightString(550, y, f"{donation['amount']:,.2f}")
+        y -= 16
+
+    c.line(50, y + 8, 550, y + 8)
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y - 8, "Total")
+    c.drawRightString(550, y - 8, f"Rs. {statement['total']:,.2f}")
+
+    y -= 40
+    c.setFont("Helvetica", 10)
+    c.drawString(50, y, "Donations to the Foundation are eligible for deduction under Section 80G")
+    c.drawString(50, y - 14, "of the Income Tax Act, 1961.")
+
+    y -= 44
+    c.setFont("Helvetica-Bold", 12)
+    c.drawString(50, y, "Organization Details:")
+    c.setFont("Helvetica", 11)
+    for i, line in enumerate(ORGANIZATION_LINES):
+        c.drawString(50, y - 20 - 15 * i, line)
+
+    c.showPage()
+    c.save()
+    # secure_filename is lossy (a+b@x.org and ab@x.org both become abx.org);
+    # the hash of the exact address keeps every donor's file distinct
+    email = statement['donor_email']
+    digest = hashlib.sha1(email.encode('utf-8')).hexdigest()[:8]
+    filename = f"statement_{statement['label']}_{secure_filename(email)}_{digest}.pdf"
+    return filename, buffer.getvalue()
+
+
+def render_receipt_file(receipt):
+    """Render a single receipt; returns (filename, pdf bytes)"""
+    return f"Donation_Receipt_{secure_filename(str(receipt['donation_id']))}.pdf", render_receipt(receipt)
+
+
+def receipt_from_row(row):
+    return {
+        'donation_id': row['donation_id'],
+        'date': datetime.fromisoformat(row['timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
+        'name': row['donor_name'],
+        'email': row['donor_email'],
+        'phone': row['donor_phone'],
+        'program': row['program'],
+        'amount': row['amount'],
+    }
+
+
+def bounded_map(executor, func, items, max_pending):
+    """Like executor.map, but pulls from `items` lazily with at most max_pending in flight"""
+    if executor is None:
+        yield from map(func, items)
+        return
+
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(func, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ExportWriter:
+    """Writes (filename, bytes) pairs into a ZIP file or a directory"""
+
+    def __init__(self, out):
+        self.out = out
+        if out.endswith('.zip'):
+            os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+            # PDF page streams are already compressed
+            self.zip = zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED)
+        else:
+            os.makedirs(out, exist_ok=True)
+            self.zip = None
+
+    def write(self, filename, data):
+        if self.zip is not None:
+            self.zip.writestr(filename, data)
+        else:
+            with open(os.path.join(self.out, filename), 'wb') as f:
+                f.write(data)
+
+    def close(self):
+        if self.zip is not None:
+            self.zip.close()
+
+
+def export(kind, start, end, out, label=None, workers=0, chunk_size=CHUNK_SIZE,
+           report=None, report_every=100):
+    """Render statements or receipts for donations in [start, end) into `out`
+
+    Returns {'files', 'bytes', 'seconds', 'per_second'}. `report` is called
+    with the same dict every `report_every` files.
+    """
+    executor = None
+    if workers > 0:
+        executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+    conn = connect()
+    writer = ExportWriter(out)
+    started = time.perf_counter()
+    progress = {'files': 0, 'bytes': 0, 'seconds': 0.0, 'per_second': 0.0}
+    try:
+        if kind == 'statements':
+            items = iter_statements(conn, start, end, label, chunk_size)
+            func = render_statement
+        else:
+            items = map(receipt_from_row, iter_donations(conn, start, end, chunk_size=chunk_size))
+            func = render_receipt_file
+
+        for filename, pdf in bounded_map(executor, func, items, max_pending=max(workers, 1) * 4):
+            writer.write(filename, pdf)
+            progress['files'] += 1
+            progress['bytes'] += len(pdf)
+            progress['seconds'] = time.perf_counter() - started
+            progress['per_second'] = progress['files'] / progress['seconds']
+            if report and progress['files'] % report_every == 0:
+                report(dict(progress))
+    finally:
+        writer.close()
+        conn.close()
+        if executor is not None:
+            executor.shutdown()
+
+    progress['seconds'] = time.perf_counter() - started
+    progress['per_second'] = progress['files'] / progress['seconds'] if progress['seconds'] else 0.0
+    return progress
+
+
+def print_progress(progress):
+    print(f"{progress['files']} files, {progress['bytes'] / 1024:.0f} KB, "
+          f"{progress['per_second']:.1f} files/s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export donation receipts or 80G statements")
+    parser.add_argument('kind', choices=['statements', 'receipts'])
+    parser.add_argument('--fy', type=int, help='financial year start, e.g. 2024 for FY2024-25')
+    parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='YYYY-MM-DD (receipts)')
+    parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='YYYY-MM-DD inclusive (receipts)')
+    parser.add_argument('--out', required=True, help='a .zip file or a directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.fy is not None:
+        start, end, label = financial_year(args.fy)
+    elif args.kind == 'receipts' and args.date_from and args.date_to:
+        start, end = args.date_from, date.fromordinal(args.date_to.toordinal() + 1)
+        label = None
+    else:
+        parser.error('give --fy, or --from and --to for receipts')
+
+    result = export(args.kind, start, end, args.out, label=label, workers=args.workers,
+                    chunk_size=args.chunk_size, report=print_progress)
+    print(f"Wrote {result['files']} files to {args.out} in {result['seconds']:.1f}s "
+          f"({result['per_second']:.1f} files/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def site_dir(tmp_path_factory):
+    """Scratch working directory with a copy of data/; the database and logs are created here"""
+    workdir = tmp_path_factory.mktemp('site')
+    shutil.copytree(os.path.join(REPO_DIR, 'data'), workdir / 'data')
+    previous = os.getcwd()
+    os.chdir(workdir)
+    yield workdir
+    os.chdir(previous)
+
+
+@pytest.fixture(scope='session')
+def app_module(site_dir):
+    """The app module, imported inside site_dir with no background mail/SMS workers"""
+    os.environ.setdefault('JOB_WORKERS', '0')
+    os.environ.setdefault('RECEIPT_WORKERS', '0')
+    os.environ.pop('METRICS_DIR', None)
+    import app
+    assert os.path.dirname(os.path.abspath(app.__file__)) == REPO_DIR, sys.path
+    return app
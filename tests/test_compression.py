@@ -0,0 +1,135 @@
+import gzip
+import zlib
+
+import pytest
+from werkzeug.test import Client, EnvironBuilder
+
+import compression
+from compression import CompressionMiddleware
+
+TEXT = b'<p>The Smiling Tear Foundation</p>\n' * 100
+
+
+def make_app(body=TEXT, content_type='text/html; charset=utf-8', headers=(), chunks=None):
+    """A WSGI app answering with body (or the given chunks, without a Content-Length)"""
+    def app(environ, start_response):
+        response_headers = [('Content-Type', content_type)] + list(headers)
+        if chunks is None:
+            response_headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', response_headers)
+        return iter(chunks) if chunks is not None else [body]
+    return app
+
+
+def get(app, accept_encoding='gzip', **kwargs):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    return Client(CompressionMiddleware(app, **kwargs)).get('/', headers=headers)
+
+
+def test_gzip_when_accepted():
+    response = get(make_app())
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data) == TEXT
+
+
+def test_identity_without_accept_encoding():
+    response = get(make_app(), accept_encoding=None)
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == TEXT
+
+
+def test_gzip_refused_with_q_zero():
+    response = get(make_app(), accept_encoding='gzip;q=0, identity')
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == TEXT
+
+
+def test_strong_etag_is_weakened():
+    response = get(make_app(headers=[('ETag', '"abc"')]))
+    assert response.headers['ETag'] == 'W/"abc"'
+
+
+@pytest.mark.skipif(compression.brotli is None, reason='brotli is not installed')
+def test_brotli_preferred_when_installed():
+    response = get(make_app(), accept_encoding='gzip, br')
+    assert response.headers['Content-Encoding'] == 'br'
+    assert compression.brotli.decompress(response.data) == TEXT
+
+
+@pytest.mark.skipif(compression.brotli is not None, reason='brotli is installed')
+def test_br_only_client_gets_identity_without_brotli():
+    response = get(make_app(), accept_encoding='br')
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == TEXT
+
+
+def test_negotiate_uses_q_values():
+    middleware = CompressionMiddleware(make_app())
+    assert middleware.negotiate('gzip;q=0.5, deflate') == 'gzip'
+    assert middleware.negotiate('deflate') is None
+    assert middleware.negotiate('') is None
+
+
+def test_below_min_size_is_not_compressed():
+    body = b'x' * 499
+    response = get(make_app(body), min_size=500)
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == body
+
+
+def test_at_min_size_is_compressed():
+    body = b'x' * 500
+    response = get(make_app(body), min_size=500)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == body
+
+
+def test_small_stream_is_sent_whole_with_length():
+    response = get(make_app(chunks=[b'a' * 100, b'b' * 100]), min_size=500)
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Content-Length'] == '200'
+    assert response.data == b'a' * 100 + b'b' * 100
+
+
+def test_streamed_body_is_flushed_per_chunk():
+    chunks = [b'<li>%d</li>' % i * 60 for i in range(5)]
+    environ = EnvironBuilder(path='/', headers={'Accept-Encoding': 'gzip'}).get_environ()
+    statuses = []
+    middleware = CompressionMiddleware(make_app(chunks=chunks), min_size=500)
+    out = list(middleware(environ, lambda status, headers, exc_info=None: statuses.append(dict(headers))))
+
+    assert statuses[0]['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in statuses[0]
+    # Every piece but the trailer decodes on its own: nothing is held back between chunks
+    decoder = zlib.decompressobj(31)
+    assert [decoder.decompress(piece) for piece in out[:-1]] == chunks
+    assert decoder.decompress(out[-1]) == b''
+    assert decoder.eof
+
+
+@pytest.mark.parametrize('content_type', ['application/pdf', 'image/jpeg'])
+def test_binary_types_pass_through(content_type):
+    body = bytes(range(256)) * 10
+    response = get(make_app(body, content_type=content_type))
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == body
+
+
+def test_already_encoded_body_passes_through():
+    body = gzip.compress(TEXT)
+    response = get(make_app(body, content_type='application/json', headers=[('Content-Encoding', 'gzip')]))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.data == body
+
+
+def test_no_transform_is_respected():
+    response = get(make_app(headers=[('Cache-Control', 'no-transform')]))
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == TEXT
+
+
+def test_head_request_is_not_compressed():
+    middleware = CompressionMiddleware(make_app())
+    response = Client(middleware).head('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
@@ -0,0 +1,84 @@
+import multiprocessing
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import database
+
+THREADS = 8
+PROCESSES = 4
+ROWS_PER_WORKER = 20
+
+
+@pytest.fixture(params=[False, True], ids=['direct', 'batched'])
+def write_batching(request, app_module):
+    """Run the test with WRITE_BATCHING off and on"""
+    previous = app_module.app.config['WRITE_BATCHING']
+    app_module.app.config['WRITE_BATCHING'] = request.param
+    yield request.param
+    app_module.app.config['WRITE_BATCHING'] = previous
+
+
+def save_rows(app_module, tag, count):
+    """Save `count` donations and volunteer applications the way the form routes do"""
+    saved = []
+    for i in range(count):
+        email = f"{tag}-{i}@example.org"
+        with app_module.app.app_context():
+            donation_id, transaction_id = app_module.save_donation(
+                '100', 'education', 'Test Donor', email, '9876543210', False)
+            volunteer_id = app_module.save_volunteer_application(
+                'Test Volunteer', email, '9876543210', 'Delhi', ['education'], 'test')
+        saved.append((donation_id, transaction_id, volunteer_id))
+    return saved
+
+
+def save_rows_in_child(app_module, tag, count, results):
+    results.put(save_rows(app_module, tag, count))
+
+
+def assert_unique(saved, run_tag, expected):
+    donation_ids = [row[0] for row in saved]
+    transaction_ids = [row[1] for row in saved]
+    volunteer_ids = [row[2] for row in saved]
+    assert len(saved) == expected
+    assert len(set(donation_ids)) == expected
+    assert len(set(transaction_ids)) == expected
+    assert len(set(volunteer_ids)) == expected
+
+    conn = database.connect()
+    try:
+        donations = conn.execute("SELECT donation_id FROM donations WHERE donor_email LIKE ?",
+                                 (f"{run_tag}%",)).fetchall()
+        volunteers = conn.execute("SELECT id FROM volunteer_applications WHERE email LIKE ?",
+                                  (f"{run_tag}%",)).fetchall()
+    finally:
+        conn.close()
+    assert sorted(row[0] for row in donations) == sorted(donation_ids)
+    assert sorted(row[0] for row in volunteers) == sorted(volunteer_ids)
+
+
+def test_ids_are_unique_across_threads(app_module, write_batching):
+    run_tag = uuid.uuid4().hex
+    with ThreadPoolExecutor(THREADS) as pool:
+        batches = pool.map(lambda n: save_rows(app_module, f"{run_tag}-t{n}", ROWS_PER_WORKER), range(THREADS))
+        saved = [row for batch in batches for row in batch]
+    assert_unique(saved, run_tag, THREADS * ROWS_PER_WORKER)
+
+
+def test_ids_are_unique_across_processes(app_module, write_batching):
+    # Forked like gunicorn workers: every child opens its own pool and writer thread
+    ctx = multiprocessing.get_context('fork')
+    run_tag = uuid.uuid4().hex
+    results = ctx.Queue()
+    children = [ctx.Process(target=save_rows_in_child,
+                            args=(app_module, f"{run_tag}-p{n}", ROWS_PER_WORKER, results))
+                for n in range(PROCESSES)]
+    for child in children:
+        child.start()
+    saved = [row for _ in children for row in results.get(timeout=60)]
+    for child in children:
+        child.join(timeout=60)
+        assert child.exitcode == 0
+    assert_unique(saved, run_tag, PROCESSES * ROWS_PER_WORKER)
@@ -0,0 +1,45 @@
+import os
+import threading
+
+from PIL import Image
+
+from images import ImagePipeline
+
+
+def make_pipeline(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'images').mkdir(parents=True)
+    Image.new('RGB', (800, 600), (200, 80, 40)).save(static / 'images' / 'photo.jpg')
+    return ImagePipeline(static, tmp_path / 'cache', widths=(320, 640), formats=('webp',))
+
+
+def test_concurrent_requests_render_a_derivative_once(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    start = threading.Barrier(8)
+    paths = []
+
+    def request():
+        start.wait()
+        paths.append(pipeline.derivative('images/photo.jpg', 640, 'webp'))
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(paths)) == 1
+    assert pipeline.stats()['generated'] == 1
+    with Image.open(paths[0]) as im:
+        assert (im.format, im.width) == ('WEBP', 640)
+
+
+def test_changed_source_is_rendered_again(tmp_path):
+    pipeline = make_pipeline(tmp_path)
+    path = pipeline.derivative('images/photo.jpg', 320, 'jpeg')
+    source = tmp_path / 'static' / 'images' / 'photo.jpg'
+    newer = os.stat(path).st_mtime_ns + 10**9
+    os.utime(source, ns=(newer, newer))
+
+    assert pipeline.derivative('images/photo.jpg', 320, 'jpeg') == path
+    assert pipeline.stats()['generated'] == 2
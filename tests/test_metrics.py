@@ -0,0 +1,29 @@
+import pytest
+
+
+def donation_amount(app_module, program='education'):
+    return app_module.metrics_registry.snapshot().get('donation_amount_total', {}).get((program,), 0)
+
+
+@pytest.mark.parametrize('amount', ['nan', 'NaN', 'inf', '-inf', '-500', '0', 'abc', '', None])
+def test_unusable_amounts_leave_the_amount_counter_alone(app_module, amount):
+    before = donation_amount(app_module)
+    app_module.count_donation('education', amount)
+    assert donation_amount(app_module) == before
+
+
+def test_positive_amounts_are_counted(app_module):
+    before = donation_amount(app_module)
+    app_module.count_donation('education', '500')
+    app_module.count_donation('education', 250.5)
+    assert donation_amount(app_module) == before + 750.5
+
+
+def test_nan_donation_does_not_reach_metrics_page(app_module):
+    client = app_module.app.test_client()
+    response = client.post('/donate', data={'amount': 'nan', 'program': 'education', 'name': 'A',
+                                            'email': 'a@example.org', 'phone': '9876543210'})
+    assert response.status_code < 500
+    page = client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}).get_data(as_text=True)
+    amounts = [line for line in page.splitlines() if line.startswith('donation_amount_total')]
+    assert not any(line.endswith(('nan', 'inf')) for line in amounts)